@@ -0,0 +1,63 @@
+"""
+Mesure le nombre de connexions par seconde supportées selon le coût scrypt (PASSWORD_SCRYPT_LOG_N).
+
+Chaque connexion coûte une vérification de mot de passe ; le reste de /login est négligeable
+en comparaison. Exemple :
+    python bench_passwords.py --costs 10 12 14 15 --logins 200 --workers 4
+"""
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from passwords import HasherBusy, PasswordHasher
+
+
+def bench(log_n, logins, workers, clients, max_pending):
+    """
+    Lance `logins` vérifications depuis `clients` threads simultanés et retourne
+    (connexions/s acceptées, latence moyenne en ms, nombre de refus pour saturation).
+    """
+    hasher = PasswordHasher(log_n=log_n, workers=workers, max_pending=max_pending)
+    stored = hasher.hash("mot_de_passe")
+    latencies = []
+    lock = threading.Lock()
+
+    def login(_):
+        start = time.perf_counter()
+        try:
+            hasher.verify("mot_de_passe", stored)
+        except HasherBusy:
+            return
+        with lock:
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(login, range(logins)))
+    elapsed = time.perf_counter() - start
+    average = sum(latencies) / len(latencies) * 1000 if latencies else 0.0
+    return len(latencies) / elapsed, average, hasher.rejected
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark du hash des mots de passe.")
+    parser.add_argument("--costs", type=int, nargs="+", default=[10, 12, 13, 14, 15], help="Valeurs de log2(N) à tester")
+    parser.add_argument("--logins", type=int, default=100, help="Connexions simulées par coût")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="Taille du pool de hash")
+    parser.add_argument("--clients", type=int, default=16, help="Requêtes simultanées")
+    parser.add_argument("--max-pending", type=int, default=None,
+                        help="Limite de la file (par défaut : --clients, donc aucun refus)")
+    args = parser.parse_args()
+    max_pending = args.max_pending or args.clients
+
+    print(f"{'log2(N)':>8} {'mémoire':>9} {'connexions/s':>13} {'latence (ms)':>13} {'refus':>6}")
+    for log_n in args.costs:
+        rate, latency, rejected = bench(log_n, args.logins, args.workers, args.clients, max_pending)
+        memory = 128 * 8 * (1 << log_n) // (1 << 20)
+        print(f"{log_n:>8} {memory:>7}Mo {rate:>13.1f} {latency:>13.1f} {rejected:>6}")
+
+
+if __name__ == '__main__':
+    main()
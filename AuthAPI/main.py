@@ -8,11 +8,22 @@
 # \__|  \__| \______/    \____/ \__|  \__|
                                         
 import os
-import requests
-from flask import Flask, request, jsonify
-from pymongo import MongoClient
+import sys
+from flask import Flask, Response, request, jsonify
+from pymongo import MongoClient, ASCENDING
+from pymongo.errors import BulkWriteError
 import hashlib
 import datetime
+import secrets
+
+# Modules partagés (à la racine du dépôt en local, copiés dans /app/common dans l'image Docker)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.indexes import ensure_indexes
+from common.ndjson import chunked, dump_ndjson_line, parse_ndjson
+from common.tokens import TokenError, TokenSigner, is_signed_token
+from token_store import TokenStore
+from provisioning import PlayerProvisioner
+from passwords import HasherBusy, PasswordHasher
 
 # Initialisation de Flask
 app = Flask(__name__)
@@ -22,6 +33,17 @@ DB_HOST = os.getenv('DB_HOST', 'localhost')
 DB_PORT = int(os.getenv('DB_PORT', 27017))
 API_PORT = int(os.getenv('API_PORT', 5000))
 PLAYER_API_URL = os.getenv('PLAYER_API_URL', 'http://localhost:5001')  # URL de l'API Player
+MAX_BATCH_VALIDATION = int(os.getenv('MAX_BATCH_VALIDATION', 500))  # Nombre maximal de tokens par lot
+TOKEN_FLUSH_INTERVAL = float(os.getenv('TOKEN_FLUSH_INTERVAL', 5))  # Intervalle d'écriture des expirations (secondes)
+ADMIN_API_KEY = os.getenv('ADMIN_API_KEY', 'CLE_ADMIN_TRES_SAFE')  # Clé des endpoints d'administration
+BULK_CHUNK_SIZE = int(os.getenv('BULK_CHUNK_SIZE', 1000))  # Taille des lots d'insertion en masse
+TOKEN_MODE = os.getenv('AUTH_TOKEN_MODE', 'opaque')  # "opaque" (vérifié en base) ou "signed" (vérifiable localement)
+SIGNED_TOKEN_TTL = int(os.getenv('SIGNED_TOKEN_TTL', 8 * 3600))  # Durée de vie des tokens signés (secondes)
+
+# Clés de signature des tokens (AUTH_SIGNING_KEYS="id:secret,...", AUTH_ACTIVE_KEY_ID)
+signer = TokenSigner.from_env()
+if TOKEN_MODE == 'signed' and signer is None:
+    raise RuntimeError("AUTH_TOKEN_MODE=signed nécessite AUTH_SIGNING_KEYS.")
 
 # Connexion à MongoDB
 print(f"Connexion à MongoDB sur {DB_HOST}:{DB_PORT}...")
@@ -29,6 +51,40 @@ client = MongoClient(f'mongodb://{DB_HOST}:{DB_PORT}/')
 db = client['auth_db']
 users_collection = db['users']
 tokens_collection = db['tokens']
+revoked_tokens_collection = db['revoked_tokens']  # Tokens signés révoqués avant leur expiration
+provisioning_collection = db['player_provisioning']  # Outbox des joueurs à créer dans PlayerAPI
+
+# Hash des mots de passe (scrypt, coût réglable via PASSWORD_SCRYPT_*) exécuté hors du thread de requête
+password_hasher = PasswordHasher.from_env()
+# Coût réduit pour le provisionnement en masse : ces hash sont remis au coût normal à la première connexion
+bulk_password_hasher = PasswordHasher(log_n=int(os.getenv('BULK_SCRYPT_LOG_N', 10)), workers=os.cpu_count() or 2)
+
+# Index nécessaires au service, créés une seule fois au démarrage
+# (collection, clés, options). Les index TTL laissent Mongo purger les tokens expirés ; la marge
+# couvre les prolongations encore en mémoire dans le TokenStore au moment de l'expiration en base.
+# Mongo compare les dates TTL à l'heure UTC : toutes les dates d'expiration sont écrites en UTC.
+INDEXES = [
+    (users_collection, [("username", ASCENDING)], {"unique": True}),
+    (tokens_collection, [("token", ASCENDING)], {"unique": True}),
+    (tokens_collection, [("expires_at", ASCENDING)], {"expireAfterSeconds": 300}),
+    (revoked_tokens_collection, [("jti", ASCENDING)], {"unique": True}),
+    (revoked_tokens_collection, [("expires_at", ASCENDING)], {"expireAfterSeconds": 0}),
+    (provisioning_collection, [("status", ASCENDING), ("next_attempt_at", ASCENDING)], {}),
+]
+
+ensure_indexes(INDEXES)
+
+# Index en mémoire des tokens opaques, avec écriture différée des prolongations
+token_store = TokenStore(tokens_collection, flush_interval=TOKEN_FLUSH_INTERVAL)
+token_store.start()
+
+# Worker de création des joueurs dans PlayerAPI (outbox alimentée par /register)
+provisioner = PlayerProvisioner(
+    provisioning_collection, PLAYER_API_URL, ADMIN_API_KEY,
+    batch_size=int(os.getenv('PROVISIONING_BATCH_SIZE', 500)),
+    max_attempts=int(os.getenv('PROVISIONING_MAX_ATTEMPTS', 20)),
+)
+provisioner.start()
 
 # Endpoint pour vérifier le fonctionnement de l'API (public)
 @app.route('/health', methods=['GET'])
@@ -38,16 +94,76 @@ def health_check():
     """
     return jsonify({"message": "L'API fonctionne correctement !"}), 200
 
+# Endpoint pour exposer les métriques internes du service (public)
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Retourne les compteurs de l'index de tokens en mémoire, de l'outbox de provisionnement et du hash des mots de passe.
+    """
+    return jsonify({
+        "token_store": token_store.stats(),
+        "provisioning": provisioner.stats(),
+        "password_hasher": password_hasher.stats(),
+    }), 200
+
 # Endpoint pour générer un token unique
 def generate_token(username):
     """
-    Le token est basé sur le nom d'utilisateur, la date et l'heure actuelles.
+    Le token est basé sur le nom d'utilisateur, la date et l'heure actuelles,
+    plus un sel aléatoire pour rester unique (index unique) si deux connexions tombent dans la même seconde.
     """
     now = datetime.datetime.now().strftime("%Y/%m/%d-%H:%M:%S")
-    token_str = f"{username}-{now}"
+    token_str = f"{username}-{now}-{secrets.token_hex(8)}"
     token = hashlib.sha256(token_str.encode()).hexdigest()
     return token
 
+def issue_token(username):
+    """
+    Génère un token pour l'utilisateur : signé (rien à stocker) ou opaque (enregistré dans le TokenStore).
+    """
+    if TOKEN_MODE == 'signed':
+        # Token autoporteur : les services le vérifient eux-mêmes
+        token, _ = signer.sign(username, SIGNED_TOKEN_TTL)
+    else:
+        token = generate_token(username)
+        expiration_time = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+
+        # Stockage du token et de sa date d'expiration
+        token_store.add(token, username, expiration_time)
+    print(f"Token généré pour l'utilisateur {username}.")
+    return token
+
+def issue_tokens(usernames):
+    """
+    Génère un token par utilisateur en une seule écriture (provisionnement en masse).
+    Retourne {username: token}.
+    """
+    if TOKEN_MODE == 'signed':
+        return {username: signer.sign(username, SIGNED_TOKEN_TTL)[0] for username in usernames}
+    tokens = {username: generate_token(username) for username in usernames}
+    expiration_time = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+    token_store.add_many([(token, username, expiration_time) for username, token in tokens.items()])
+    return tokens
+
+def resolve_username(token):
+    """
+    Retourne le nom d'utilisateur d'un token valide (signé ou opaque), sinon None.
+    """
+    if not token:
+        return None
+    if is_signed_token(token):
+        try:
+            claims = signer.verify(token) if signer else None
+        except TokenError:
+            return None
+        if not claims or revoked_tokens_collection.find_one({"jti": claims["jti"]}):
+            return None
+        return claims["sub"]
+    token_data = token_store.get(token)
+    if not token_data or datetime.datetime.utcnow() > token_data["expires_at"]:
+        return None
+    return token_data["username"]
+
 # Endpoint pour enregistrer un nouvel utilisateur
 @app.route('/register', methods=['POST'])
 def register():
@@ -67,15 +183,14 @@ def register():
         return jsonify({"error": "Identifiant et mot de passe requis."}), 400
 
     try:
-        # Utiliser un index unique pour éviter les doublons au niveau de MongoDB
-        users_collection.create_index("username", unique=True)
-    except Exception as e:
-        print(f"Erreur lors de la création de l'index unique : {e}")
-        return jsonify({"error": "Erreur interne du système."}), 500
+        password_hash = password_hasher.hash(password)
+    except HasherBusy:
+        print("Erreur : Pool de hash saturé, inscription refusée.")
+        return jsonify({"error": "Service surchargé, réessayez dans un instant."}), 503, {"Retry-After": "1"}
 
     try:
-        # Tenter d'insérer l'utilisateur
-        users_collection.insert_one({"username": username, "password": password})
+        # Tenter d'insérer l'utilisateur (l'index unique sur username empêche les doublons)
+        users_collection.insert_one({"username": username, "password": password_hash})
         print(f"Utilisateur {username} enregistré avec succès.")
     except Exception as e:
         # Vérifier si l'erreur provient d'une duplication
@@ -85,35 +200,99 @@ def register():
         print(f"Erreur inconnue lors de l'enregistrement : {e}")
         return jsonify({"error": "Erreur interne du système."}), 500
 
-    # Authentifier l'utilisateur pour générer un token
+    # Création du joueur déléguée au worker : sans demande enregistrée, le compte est annulé
+    # pour que l'inscription puisse être retentée
     try:
-        token_response = requests.post(
-            f"http://localhost:{API_PORT}/login",
-            json={"identifiant": username, "password": password}
-        )
-        if token_response.status_code != 200:
-            print(f"Erreur lors de l'authentification de l'utilisateur {username}: {token_response.text}")
-            return jsonify({"error": "Utilisateur enregistré, mais échec de l'authentification."}), 500
-        token = token_response.json().get("token")
-    except requests.exceptions.RequestException as e:
-        print(f"Erreur de communication avec AuthAPI pour l'authentification : {e}")
-        return jsonify({"error": "Erreur de communication avec AuthAPI."}), 500
-
-    # Création du joueur dans PlayerAPI
+        provisioner.enqueue(username)
+    except Exception as e:
+        print(f"Erreur lors de la mise en file de la création du joueur {username}, inscription annulée : {e}")
+        users_collection.delete_one({"username": username})
+        return jsonify({"error": "Service indisponible, réessayez dans un instant."}), 503, {"Retry-After": "1"}
+
+    token = issue_token(username)
+
+    return jsonify({
+        "message": "Utilisateur enregistré avec succès, création du joueur en cours.",
+        "token": token,
+        "provisioning": "pending",
+    }), 201
+
+# Endpoint d'administration pour créer des comptes en masse (jeux de données de test de charge)
+@app.route('/admin/users/bulk', methods=['POST'])
+def bulk_register():
+    """
+    Réservé à l'administration (header X-Admin-Key).
+    Corps NDJSON, une ligne par utilisateur :
+      - identifiant, password
+      - level, experience (optionnels) : état initial du joueur dans PlayerAPI
+    Réponse NDJSON, une ligne par utilisateur : {"identifiant", "token"} ou {"identifiant", "error"}.
+    Les joueurs sont créés dans PlayerAPI par lots via l'outbox de provisionnement.
+    """
+    if request.headers.get('X-Admin-Key') != ADMIN_API_KEY:
+        return jsonify({"error": "Accès non autorisé."}), 403
+
     try:
-        response = requests.post(
-            f"{PLAYER_API_URL}/player",
-            json={"username": username},
-            headers={"Authorization": token},  # Utiliser le token généré
+        entries = parse_ndjson(request.get_data(as_text=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    for line_number, entry in enumerate(entries, start=1):
+        level, experience = entry.get("level", 1), entry.get("experience", 0)
+        if not entry.get("identifiant") or not entry.get("password"):
+            return jsonify({"error": f"Entrée {line_number} : identifiant et mot de passe requis."}), 400
+        if not isinstance(level, int) or level < 1 or not isinstance(experience, int) or experience < 0:
+            return jsonify({"error": f"Entrée {line_number} : niveau ou expérience invalide."}), 400
+
+    print(f"Provisionnement en masse de {len(entries)} utilisateur(s).")
+
+    def generate():
+        for chunk in chunked(entries, BULK_CHUNK_SIZE):
+            for result in bulk_register_chunk(chunk):
+                yield dump_ndjson_line(result)
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+def bulk_register_chunk(chunk):
+    """
+    Crée un lot d'utilisateurs : hash en parallèle, un insert_many, une écriture de tokens,
+    une écriture dans l'outbox de provisionnement.
+    """
+    hashes = bulk_password_hasher.hash_many([entry["password"] for entry in chunk])
+    errors = {}
+    try:
+        users_collection.insert_many(
+            [{"username": entry["identifiant"], "password": password_hash} for entry, password_hash in zip(chunk, hashes)],
+            ordered=False,
         )
-        if response.status_code != 201:
-            print(f"Erreur lors de la création du joueur dans PlayerAPI : {response.text}")
-            return jsonify({"error": "Utilisateur enregistré, mais erreur lors de la création du joueur."}), 500
-    except requests.exceptions.RequestException as e:
-        print(f"Erreur de communication avec PlayerAPI : {e}")
-        return jsonify({"error": "Erreur de communication avec PlayerAPI."}), 500
+    except BulkWriteError as e:
+        for error in e.details.get("writeErrors", []):
+            duplicate = error.get("code") == 11000
+            errors[error["index"]] = "Utilisateur déjà enregistré." if duplicate else "Erreur interne du système."
+
+    created = [entry for index, entry in enumerate(chunk) if index not in errors]
+    tokens = issue_tokens([entry["identifiant"] for entry in created])
+    provisioner.enqueue_many([
+        {"username": entry["identifiant"], "level": entry.get("level", 1), "experience": entry.get("experience", 0)}
+        for entry in created
+    ])
+    print(f"Lot de {len(chunk)} utilisateur(s) traité ({len(created)} créé(s)).")
 
-    return jsonify({"message": "Utilisateur enregistré avec succès et joueur créé.", "token": token}), 201
+    for index, entry in enumerate(chunk):
+        if index in errors:
+            yield {"identifiant": entry["identifiant"], "error": errors[index]}
+        else:
+            yield {"identifiant": entry["identifiant"], "token": tokens[entry["identifiant"]]}
+
+# Endpoint pour suivre la création du joueur après l'inscription
+@app.route('/register/status', methods=['GET'])
+def registration_status():
+    """
+    Retourne l'état de la création du joueur associé au token (header Authorization) :
+    "pending" tant que PlayerAPI n'a pas confirmé, "done" ensuite, "dead" si la création a été abandonnée.
+    """
+    username = resolve_username(request.headers.get('Authorization'))
+    if not username:
+        return jsonify({"error": "Token invalide ou expiré."}), 401
+    return jsonify({"username": username, "status": provisioner.status(username)}), 200
 
 # Endpoint pour générer un token
 @app.route('/login', methods=['POST'])
@@ -133,21 +312,29 @@ def login():
         return jsonify({"error": "Identifiant et mot de passe requis."}), 400
 
     user = users_collection.find_one({"username": username})
-    if not user or user['password'] != password:
+    if not user:
         print(f"Erreur : Authentification échouée pour l'utilisateur {username}.")
         return jsonify({"error": "Identifiants incorrects."}), 401
 
-    # Génération du token
-    token = generate_token(username)
-    expiration_time = datetime.datetime.now() + datetime.timedelta(hours=1)
+    try:
+        valid, needs_rehash = password_hasher.verify(password, user['password'])
+    except HasherBusy:
+        print("Erreur : Pool de hash saturé, connexion refusée.")
+        return jsonify({"error": "Service surchargé, réessayez dans un instant."}), 503, {"Retry-After": "1"}
 
-    # Stockage du token et de sa date d'expiration
-    tokens_collection.insert_one({
-        "token": token,
-        "username": username,
-        "expires_at": expiration_time
-    })
-    print(f"Token généré pour l'utilisateur {username}.")
+    if not valid:
+        print(f"Erreur : Authentification échouée pour l'utilisateur {username}.")
+        return jsonify({"error": "Identifiants incorrects."}), 401
+
+    if needs_rehash:
+        # Mot de passe en clair hérité (ou ancien coût) : mise à niveau en arrière-plan,
+        # conditionnée à la valeur lue pour ne pas écraser une mise à jour concurrente
+        stored = user['password']
+        password_hasher.rehash_async(password, lambda new_hash: users_collection.update_one(
+            {"_id": user["_id"], "password": stored}, {"$set": {"password": new_hash}}
+        ))
+
+    token = issue_token(username)
     return jsonify({"token": token}), 200
 
 # Endpoint pour valider un token
@@ -165,22 +352,144 @@ def validate_token():
         print("Erreur : Aucun token fourni.")
         return jsonify({"error": "Token requis."}), 400
 
-    token_data = tokens_collection.find_one({"token": token})
+    if is_signed_token(token):
+        return validate_signed_token(token)
+
+    token_data = token_store.get(token)
 
     if not token_data:
         print("Erreur : Token invalide.")
         return jsonify({"error": "Token invalide."}), 401
 
-    if datetime.datetime.now() > token_data["expires_at"]:
+    if datetime.datetime.utcnow() > token_data["expires_at"]:
         print("Erreur : Token expiré.")
         return jsonify({"error": "Token expiré."}), 401
 
-    # Mise à jour de la date d'expiration
-    new_expiration = datetime.datetime.now() + datetime.timedelta(hours=1)
-    tokens_collection.update_one({"token": token}, {"$set": {"expires_at": new_expiration}})
+    # Mise à jour de la date d'expiration (persistée par lot par le TokenStore)
+    new_expiration = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+    token_store.extend([token], new_expiration)
     print(f"Token validé pour l'utilisateur {token_data['username']}.")
     return jsonify({"username": token_data["username"]}), 200
 
+# Endpoint pour valider plusieurs tokens en une seule requête
+@app.route('/validate/batch', methods=['POST'])
+def validate_tokens_batch():
+    """
+    Argument :
+      - tokens : la liste des tokens à valider
+    Retourne, pour chaque token, le nom d'utilisateur associé ou null s'il est invalide ou expiré.
+    """
+    data = request.json
+    tokens = data.get('tokens')
+
+    if not isinstance(tokens, list) or not tokens:
+        print("Erreur : Liste de tokens manquante.")
+        return jsonify({"error": "Liste de tokens requise."}), 400
+    if len(tokens) > MAX_BATCH_VALIDATION:
+        print(f"Erreur : Trop de tokens ({len(tokens)}).")
+        return jsonify({"error": f"{MAX_BATCH_VALIDATION} tokens maximum par lot."}), 400
+
+    tokens = list(dict.fromkeys(tokens))
+    results = {token: None for token in tokens}
+    signed_tokens = [token for token in tokens if is_signed_token(token)]
+    opaque_tokens = [token for token in tokens if not is_signed_token(token)]
+
+    # Tokens signés : vérification locale puis une seule requête sur la liste de révocation
+    if signed_tokens and signer is not None:
+        claims_by_token = {}
+        for token in signed_tokens:
+            try:
+                claims_by_token[token] = signer.verify(token)
+            except TokenError:
+                pass
+        revoked = {
+            entry["jti"] for entry in revoked_tokens_collection.find(
+                {"jti": {"$in": [claims["jti"] for claims in claims_by_token.values()]}}, {"jti": 1}
+            )
+        } if claims_by_token else set()
+        for token, claims in claims_by_token.items():
+            if claims["jti"] not in revoked:
+                results[token] = claims["sub"]
+
+    # Tokens opaques : index en mémoire (une seule requête $in pour les absents), prolongation différée
+    if opaque_tokens:
+        now = datetime.datetime.utcnow()
+        valid_tokens = []
+        for token, token_data in token_store.get_many(opaque_tokens).items():
+            if now <= token_data["expires_at"]:
+                results[token] = token_data["username"]
+                valid_tokens.append(token)
+        token_store.extend(valid_tokens, now + datetime.timedelta(hours=1))
+
+    print(f"Lot de {len(tokens)} token(s) validé ({sum(1 for username in results.values() if username)} valide(s)).")
+    return jsonify({"results": results}), 200
+
+def validate_signed_token(token):
+    """
+    Valide un token signé : signature, expiration et liste de révocation.
+    """
+    if signer is None:
+        print("Erreur : Token signé reçu mais aucune clé de signature configurée.")
+        return jsonify({"error": "Token invalide."}), 401
+    try:
+        claims = signer.verify(token)
+    except TokenError as e:
+        print(f"Erreur : {e}")
+        return jsonify({"error": str(e)}), 401
+
+    if revoked_tokens_collection.find_one({"jti": claims["jti"]}):
+        print("Erreur : Token révoqué.")
+        return jsonify({"error": "Token révoqué."}), 401
+
+    print(f"Token signé validé pour l'utilisateur {claims['sub']}.")
+    return jsonify({"username": claims["sub"]}), 200
+
+# Endpoint pour révoquer un token (déconnexion)
+@app.route('/revoke', methods=['POST'])
+def revoke_token():
+    """
+    Argument :
+      - token : le token à révoquer
+    """
+    data = request.json
+    token = data.get('token')
+
+    if not token:
+        print("Erreur : Aucun token fourni.")
+        return jsonify({"error": "Token requis."}), 400
+
+    if not is_signed_token(token):
+        token_store.remove(token)
+        print("Token opaque révoqué.")
+        return jsonify({"message": "Token révoqué."}), 200
+
+    try:
+        claims = signer.verify(token) if signer else None
+    except TokenError:
+        claims = None
+    if claims:
+        # Conservé jusqu'à l'expiration naturelle du token, après quoi la révocation est inutile
+        # (date en UTC : c'est l'heure de référence de l'index TTL de Mongo)
+        revoked_tokens_collection.update_one(
+            {"jti": claims["jti"]},
+            {"$set": {"jti": claims["jti"], "expires_at": datetime.datetime.utcfromtimestamp(claims["exp"])}},
+            upsert=True,
+        )
+        print(f"Token signé révoqué pour l'utilisateur {claims['sub']}.")
+    return jsonify({"message": "Token révoqué."}), 200
+
+# Endpoint pour récupérer la liste de révocation (synchronisée par les services)
+@app.route('/revoked', methods=['GET'])
+def list_revoked_tokens():
+    """
+    Retourne les identifiants (jti) des tokens signés révoqués et pas encore expirés.
+    """
+    revoked = revoked_tokens_collection.find(
+        {"expires_at": {"$gt": datetime.datetime.utcnow()}},
+        {"_id": 0, "jti": 1},
+    )
+    return jsonify({"revoked": [entry["jti"] for entry in revoked]}), 200
+
 # Point d'entrée
 if __name__ == '__main__':
     # Lancement de Flask
@@ -0,0 +1,123 @@
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Format stocké : scrypt$<log2 N>$<r>$<p>$<sel base64>$<hash base64>
+SCHEME = "scrypt"
+
+
+class HasherBusy(Exception):
+    """
+    Trop de calculs de hash en attente : la requête est refusée immédiatement plutôt que mise en file.
+    """
+
+
+def is_hashed(stored):
+    return isinstance(stored, str) and stored.startswith(SCHEME + "$")
+
+
+class PasswordHasher:
+    """
+    Hash des mots de passe avec scrypt (hashlib, sans dépendance externe), à coût configurable.
+
+    Les calculs sont exécutés dans un pool de threads borné (scrypt libère le GIL) : au-delà de
+    `max_pending` calculs en cours ou en attente, HasherBusy est levée pour que l'API réponde 503
+    immédiatement au lieu d'accumuler de la latence pendant un pic de connexions.
+    """
+
+    def __init__(self, log_n=14, r=8, p=1, workers=4, max_pending=32):
+        self.log_n = log_n
+        self.r = r
+        self.p = p
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self.rejected = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            log_n=int(os.getenv('PASSWORD_SCRYPT_LOG_N', 14)),
+            r=int(os.getenv('PASSWORD_SCRYPT_R', 8)),
+            p=int(os.getenv('PASSWORD_SCRYPT_P', 1)),
+            workers=int(os.getenv('PASSWORD_HASH_WORKERS', os.cpu_count() or 2)),
+            max_pending=int(os.getenv('PASSWORD_HASH_MAX_PENDING', 32)),
+        )
+
+    def hash(self, password):
+        """
+        Retourne le hash à stocker pour ce mot de passe.
+        """
+        return self._run(self._hash, password)
+
+    def hash_many(self, passwords):
+        """
+        Hash une liste de mots de passe en parallèle sur tout le pool (provisionnement en masse).
+        Pas de limite de file : à utiliser avec une instance dédiée pour ne pas pénaliser /login.
+        """
+        return list(self._pool.map(self._hash, passwords))
+
+    def verify(self, password, stored):
+        """
+        Vérifie un mot de passe. Retourne (valide, à_rehasher) : `à_rehasher` est vrai pour les
+        enregistrements en clair hérités ou hashés avec d'anciens paramètres de coût.
+        """
+        if not is_hashed(stored):
+            # Ancien enregistrement en clair : comparaison à temps constant, sans passer par le pool
+            return hmac.compare_digest(password.encode(), str(stored).encode()), True
+        return self._run(self._verify, password, stored)
+
+    def rehash_async(self, password, callback):
+        """
+        Calcule un nouveau hash en arrière-plan puis appelle `callback(hash)`.
+        Ignoré silencieusement si le pool est saturé (la mise à niveau se fera à la prochaine connexion).
+        """
+        if not self._slots.acquire(blocking=False):
+            return
+        future = self._pool.submit(self._hash, password)
+        future.add_done_callback(lambda f: self._finish_rehash(f, callback))
+
+    def stats(self):
+        return {"log_n": self.log_n, "r": self.r, "p": self.p, "rejected": self.rejected}
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise HasherBusy("Trop de calculs de mots de passe en attente.")
+        try:
+            return self._pool.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def _finish_rehash(self, future, callback):
+        self._slots.release()
+        try:
+            callback(future.result())
+        except Exception as e:
+            print(f"Erreur lors de la mise à niveau du hash : {e}")
+
+    def _derive(self, password, salt, log_n, r, p):
+        n = 1 << log_n
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r + (1 << 20), dklen=32)
+
+    def _hash(self, password):
+        salt = secrets.token_bytes(16)
+        digest = self._derive(password, salt, self.log_n, self.r, self.p)
+        return "$".join([
+            SCHEME, str(self.log_n), str(self.r), str(self.p),
+            base64.b64encode(salt).decode(), base64.b64encode(digest).decode(),
+        ])
+
+    def _verify(self, password, stored):
+        try:
+            _, log_n, r, p, salt, digest = stored.split("$")
+            log_n, r, p = int(log_n), int(r), int(p)
+            expected = base64.b64decode(digest)
+            actual = self._derive(password, base64.b64decode(salt), log_n, r, p)
+        except ValueError:
+            return False, False
+        valid = hmac.compare_digest(expected, actual)
+        return valid, valid and (log_n, r, p) != (self.log_n, self.r, self.p)
@@ -0,0 +1,118 @@
+import datetime
+
+from pymongo import UpdateOne
+
+from common.outbox import OutboxWorker, post_ndjson
+
+
+class PlayerProvisioner(OutboxWorker):
+    """
+    Création asynchrone des joueurs dans PlayerAPI à partir d'une outbox durable.
+
+    /register insère une demande dans `collection` (clé : le nom d'utilisateur) et rend la main ;
+    un thread vide l'outbox par lots, chaque lot étant envoyé en un seul appel à l'endpoint
+    d'administration `/admin/players/bulk` de PlayerAPI. L'opération est idempotente
+    (un joueur déjà existant n'est pas modifié), donc un lot peut être rejoué sans risque
+    tant que PlayerAPI est indisponible, avec un délai qui double à chaque échec. Après
+    `max_attempts` échecs, la demande passe en "dead" (lettre morte) au lieu d'être rejouée indéfiniment.
+
+    Les dates sont en UTC, comme celles des autres collections du service.
+    """
+
+    name = "player-provisioning"
+
+    def __init__(self, collection, player_api_url, admin_api_key, interval=2.0, batch_size=50, max_backoff=300, max_attempts=20):
+        super().__init__(interval, batch_size, max_backoff)
+        self.collection = collection
+        self.player_api_url = player_api_url
+        self.admin_api_key = admin_api_key
+        self.max_attempts = max_attempts
+
+    def enqueue(self, username):
+        """
+        Enregistre une demande de création de joueur et réveille le worker.
+        """
+        self.enqueue_many([{"username": username}])
+
+    def enqueue_many(self, players):
+        """
+        Enregistre plusieurs demandes en un seul bulk_write. Chaque joueur est un dict
+        {"username", "level" (optionnel), "experience" (optionnel)}.
+        """
+        now = datetime.datetime.utcnow()
+        operations = []
+        for player in players:
+            job = {"status": "pending", "attempts": 0, "created_at": now, "next_attempt_at": now}
+            initial_state = {key: player[key] for key in ("level", "experience") if key in player}
+            if initial_state:
+                job["player"] = initial_state
+            operations.append(UpdateOne({"_id": player["username"]}, {"$setOnInsert": job}, upsert=True))
+        if operations:
+            self.collection.bulk_write(operations, ordered=False)
+            self.wake()
+
+    def status(self, username):
+        """
+        Retourne "pending" tant que le joueur n'a pas été créé, "done" ensuite
+        (y compris pour les comptes antérieurs à l'outbox), "dead" si la création a été abandonnée.
+        """
+        job = self.collection.find_one({"_id": username}, {"status": 1})
+        return job["status"] if job else "done"
+
+    def drain(self):
+        """
+        Traite un lot de demandes arrivées à échéance. Retourne le nombre de demandes traitées.
+        """
+        now = datetime.datetime.utcnow()
+        jobs = list(
+            self.collection.find({"status": "pending", "next_attempt_at": {"$lte": now}})
+            .sort("next_attempt_at", 1)
+            .limit(self.batch_size)
+        )
+        if not jobs:
+            return 0
+
+        error = self._create_players([dict(job.get("player", {}), username=job["_id"]) for job in jobs])
+        operations = []
+        dead = 0
+        for job in jobs:
+            username = job["_id"]
+            if error is None:
+                operations.append(UpdateOne(
+                    {"_id": username},
+                    {"$set": {"status": "done", "completed_at": now}, "$inc": {"attempts": 1}},
+                ))
+            else:
+                attempts = job.get("attempts", 0) + 1
+                if attempts >= self.max_attempts:
+                    dead += 1
+                operations.append(UpdateOne(
+                    {"_id": username},
+                    {"$set": {
+                        "status": "dead" if attempts >= self.max_attempts else "pending",
+                        "attempts": attempts,
+                        "last_error": error,
+                        "next_attempt_at": self.retry_at(now, attempts),
+                    }},
+                ))
+        if error is None:
+            print(f"{len(jobs)} joueur(s) provisionné(s) dans PlayerAPI.")
+        else:
+            print(f"Échec du provisionnement de {len(jobs)} joueur(s), nouvel essai différé : {error}")
+            if dead:
+                print(f"{dead} joueur(s) abandonné(s) après {self.max_attempts} tentatives (lettre morte).")
+        self.collection.bulk_write(operations, ordered=False)
+        return len(jobs)
+
+    def stats(self):
+        return {
+            "pending": self.collection.count_documents({"status": "pending"}),
+            "dead": self.collection.count_documents({"status": "dead"}),
+        }
+
+    def _create_players(self, players):
+        """
+        Crée les joueurs dans PlayerAPI en un seul appel. Retourne None en cas de succès, sinon un message d'erreur.
+        """
+        _, error = post_ndjson(f"{self.player_api_url}/admin/players/bulk", players, self.admin_api_key, "PlayerAPI")
+        return error
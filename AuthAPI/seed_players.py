@@ -0,0 +1,75 @@
+"""
+Crée un jeu de données de joueurs synthétiques via l'endpoint d'administration /admin/users/bulk.
+
+Exemple (50 000 joueurs, tokens écrits dans tokens.ndjson) :
+    python seed_players.py --count 50000 --admin-key CLE_ADMIN_A_CHANGER --out tokens.ndjson
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import requests
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.progression import xp_to_next_level
+
+
+def generate_users(count, prefix, max_level):
+    """
+    Génère `count` utilisateurs avec un niveau et une expérience de départ aléatoires.
+    """
+    for i in range(count):
+        level = random.randint(1, max_level)
+        yield {
+            "identifiant": f"{prefix}_{i}",
+            "password": f"{prefix}_password_{i}",
+            "level": level,
+            "experience": random.randint(0, xp_to_next_level(level) - 1),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Provisionnement en masse de joueurs de test.")
+    parser.add_argument("--count", type=int, default=1000, help="Nombre de joueurs à créer")
+    parser.add_argument("--prefix", default="load_user", help="Préfixe des identifiants")
+    parser.add_argument("--max-level", type=int, default=40, help="Niveau de départ maximal")
+    parser.add_argument("--batch", type=int, default=5000, help="Utilisateurs par requête")
+    parser.add_argument("--url", default=os.getenv("AUTH_API_URL", "http://localhost:5000"), help="URL de AuthAPI")
+    parser.add_argument("--admin-key", default=os.getenv("ADMIN_API_KEY", "CLE_ADMIN_TRES_SAFE"))
+    parser.add_argument("--out", default="tokens.ndjson", help="Fichier de sortie (identifiant + token)")
+    args = parser.parse_args()
+
+    users = list(generate_users(args.count, args.prefix, args.max_level))
+    created = failed = 0
+    start = time.perf_counter()
+    with open(args.out, "w") as out:
+        for offset in range(0, len(users), args.batch):
+            batch = users[offset:offset + args.batch]
+            response = requests.post(
+                f"{args.url}/admin/users/bulk",
+                data="".join(json.dumps(user) + "\n" for user in batch).encode(),
+                headers={"X-Admin-Key": args.admin_key, "Content-Type": "application/x-ndjson"},
+                stream=True,
+            )
+            if response.status_code != 200:
+                print(f"Erreur lors du provisionnement : {response.text}")
+                return
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                result = json.loads(line)
+                if "token" in result:
+                    created += 1
+                    out.write(line.decode() + "\n")
+                else:
+                    failed += 1
+            print(f"{offset + len(batch)}/{len(users)} utilisateurs traités ({time.perf_counter() - start:.1f}s).")
+
+    print(f"Terminé : {created} créés, {failed} en erreur, tokens dans {args.out}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+import atexit
+import datetime
+import threading
+import time
+
+from pymongo import UpdateOne
+
+
+class TokenStore:
+    """
+    Index en mémoire des tokens opaques actifs, adossé à la collection Mongo des tokens.
+
+    Mongo reste la source de vérité : un token absent de la mémoire (après un redémarrage par exemple)
+    y est recherché puis gardé en mémoire. Les prolongations d'expiration ne sont appliquées qu'en
+    mémoire et marquées "à écrire" ; un thread les persiste toutes les `flush_interval` secondes
+    en un seul bulk_write, soit une écriture par token et par intervalle au lieu d'une par validation.
+    """
+
+    def __init__(self, collection, flush_interval=5.0, max_size=100000):
+        self.collection = collection
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self._tokens = {}  # token -> {"username": ..., "expires_at": ...}
+        self._dirty = {}  # token -> date d'expiration à persister
+        self._lock = threading.Lock()
+        self._thread = None
+        self.flushes = 0
+        self.flushed_writes = 0
+
+    def add(self, token, username, expires_at):
+        """
+        Enregistre un nouveau token (écriture immédiate en base, il doit survivre à un redémarrage).
+        """
+        self.collection.insert_one({"token": token, "username": username, "expires_at": expires_at})
+        with self._lock:
+            self._remember(token, username, expires_at)
+
+    def add_many(self, entries):
+        """
+        Enregistre une liste de (token, username, expires_at) avec un seul insert_many.
+        """
+        if not entries:
+            return
+        self.collection.insert_many(
+            [{"token": token, "username": username, "expires_at": expires_at} for token, username, expires_at in entries],
+            ordered=False,
+        )
+        with self._lock:
+            for token, username, expires_at in entries:
+                self._remember(token, username, expires_at)
+
+    def get(self, token):
+        return self.get_many([token]).get(token)
+
+    def get_many(self, tokens):
+        """
+        Retourne {token: {"username", "expires_at"}} pour les tokens connus (expirés compris).
+        Les tokens absents de la mémoire sont cherchés en base en une seule requête.
+        """
+        found = {}
+        with self._lock:
+            for token in tokens:
+                entry = self._tokens.get(token)
+                if entry is not None:
+                    found[token] = dict(entry)
+        missing = [token for token in tokens if token not in found]
+        if missing:
+            loaded = self.collection.find({"token": {"$in": missing}}, {"_id": 0, "token": 1, "username": 1, "expires_at": 1})
+            with self._lock:
+                for token_data in loaded:
+                    token = token_data["token"]
+                    # Une prolongation déjà en mémoire (autre requête concurrente) est plus récente
+                    entry = self._tokens.get(token) or self._remember(token, token_data["username"], token_data["expires_at"])
+                    found[token] = dict(entry)
+        return found
+
+    def extend(self, tokens, expires_at):
+        """
+        Prolonge l'expiration des tokens en mémoire ; l'écriture en base est différée.
+        """
+        with self._lock:
+            for token in tokens:
+                entry = self._tokens.get(token)
+                if entry is not None and expires_at > entry["expires_at"]:
+                    entry["expires_at"] = expires_at
+                    self._dirty[token] = expires_at
+
+    def remove(self, token):
+        """
+        Supprime un token (révocation) en mémoire et en base.
+        """
+        with self._lock:
+            self._tokens.pop(token, None)
+            self._dirty.pop(token, None)
+        self.collection.delete_one({"token": token})
+
+    def flush(self):
+        """
+        Persiste les prolongations en attente en un seul bulk_write et purge les tokens expirés de la mémoire.
+        """
+        with self._lock:
+            pending, self._dirty = self._dirty, {}
+            now = datetime.datetime.utcnow()
+            for token in [token for token, entry in self._tokens.items() if entry["expires_at"] < now]:
+                del self._tokens[token]
+        if not pending:
+            return 0
+
+        # $max : une écriture plus ancienne ne raccourcit jamais une expiration déjà persistée
+        operations = [UpdateOne({"token": token}, {"$max": {"expires_at": expires_at}}) for token, expires_at in pending.items()]
+        try:
+            self.collection.bulk_write(operations, ordered=False)
+        except Exception as e:
+            print(f"Erreur lors de l'écriture différée des tokens : {e}")
+            with self._lock:
+                for token, expires_at in pending.items():
+                    if token in self._tokens:
+                        self._dirty[token] = max(expires_at, self._dirty.get(token, expires_at))
+            return 0
+        self.flushes += 1
+        self.flushed_writes += len(operations)
+        return len(operations)
+
+    def start(self):
+        """
+        Démarre le thread d'écriture différée (et un dernier flush à l'arrêt du processus).
+        """
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="token-store-flush", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "tokens_in_memory": len(self._tokens),
+                "pending_writes": len(self._dirty),
+                "flushes": self.flushes,
+                "flushed_writes": self.flushed_writes,
+            }
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def _remember(self, token, username, expires_at):
+        # Appelé avec le verrou : libère de la place en retirant d'abord les entrées sans écriture en attente
+        if token not in self._tokens and len(self._tokens) >= self.max_size:
+            for old_token in self._tokens:
+                if old_token not in self._dirty:
+                    del self._tokens[old_token]
+                    break
+            else:
+                # Toutes les entrées attendent une écriture (flushs en échec) : la plus ancienne est écrite
+                # directement puis retirée, pour que la mémoire reste bornée à `max_size`
+                old_token = next(iter(self._tokens))
+                pending = self._dirty.pop(old_token)
+                del self._tokens[old_token]
+                try:
+                    self.collection.update_one({"token": old_token}, {"$max": {"expires_at": pending}})
+                except Exception as e:
+                    print(f"Erreur lors de l'écriture du token évincé, prolongation perdue : {e}")
+        entry = {"username": username, "expires_at": expires_at}
+        self._tokens[token] = entry
+        return entry
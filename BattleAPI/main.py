@@ -8,12 +8,18 @@
 # \_______/  \_______|  \____/  \____/ \__| \_______|
 
 import os
+import sys
 import requests
 from flask import Flask, request, jsonify
 from pymongo import MongoClient
 from bson import ObjectId
 import datetime
 
+# Modules partagés (à la racine du dépôt en local, copiés dans /app/common dans l'image Docker)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.auth_client import AuthClient
+from common.idempotency import IdempotencyStore
+
 # Initialisation de Flask
 app = Flask(__name__)
 
@@ -30,24 +36,21 @@ client = MongoClient(f'mongodb://{DB_HOST}:{DB_PORT}/')
 db = client['battle_db']
 battles_collection = db['battles']
 
-# Validation du token via AuthAPI
-def validate_token(token):
-    try:
-        response = requests.post(f"{AUTH_API_URL}/validate", json={"token": token})
-        if response.status_code == 200:
-            return response.json().get("username")
-        return None
-    except requests.exceptions.RequestException:
-        return None
+# Réponses des combats portant un header Idempotency-Key (rejouées en cas de doublon)
+idempotency = IdempotencyStore(db['idempotency_keys'], ttl=int(os.getenv('IDEMPOTENCY_TTL', 86400)))
+idempotency.ensure_indexes()
+
+# Client partagé de validation des tokens (avec cache)
+auth_client = AuthClient(AUTH_API_URL)
 
 # Middleware pour valider le token
 @app.before_request
 def verify_token():
-    if request.endpoint not in ['health_check']:
+    if request.endpoint not in ['health_check', 'metrics']:
         token = request.headers.get('Authorization')
         if not token:
             return jsonify({"error": "Token manquant."}), 401
-        username = validate_token(token)
+        username = auth_client.validate(token)
         if not username:
             return jsonify({"error": "Token invalide ou expiré."}), 401
         request.username = username
@@ -57,6 +60,14 @@ def verify_token():
 def health_check():
     return jsonify({"message": "L'API fonctionne correctement !"}), 200
 
+# Endpoint pour exposer les métriques internes du service (public)
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Retourne les compteurs du cache de validation des tokens et des clés d'idempotence.
+    """
+    return jsonify({"auth_cache": auth_client.stats(), "idempotency": idempotency.stats()}), 200
+
 # Exécution d'une attaque
 def execute_attack(attacker, defender, cooldowns, attacker_id, logs):
     for i in reversed(range(len(attacker["skills"]))):
@@ -119,6 +130,7 @@ def calculate_experience_gain(winner_stats, loser_stats):
 
 # Endpoint pour démarrer un combat
 @app.route('/battle', methods=['POST'])
+@idempotency.idempotent
 def start_battle():
     data = request.json
     monster1_id = data.get("monster1_id")
@@ -0,0 +1,142 @@
+import datetime
+
+from pymongo import UpdateOne
+
+from common.outbox import OutboxWorker, post_ndjson
+
+
+class InventorySync(OutboxWorker):
+    """
+    Propagation asynchrone des suppressions de monstres vers l'inventaire des joueurs (PlayerAPI).
+
+    Une suppression marque le monstre (`deleted_at`, il disparaît alors de toutes les lectures) et
+    enregistre un événement durable dans `events` ; la requête rend la main immédiatement. Un thread
+    regroupe les événements en attente en un seul appel à l'endpoint d'administration
+    `/admin/players/monsters/remove` de PlayerAPI (un `$pullAll` par joueur), puis supprime
+    définitivement les monstres concernés en un seul `delete_many`. L'opération est idempotente :
+    en cas d'échec, le lot est rejoué avec un délai qui double à chaque tentative.
+
+    La réconciliation reprend les monstres marqués depuis plus de `orphan_after` secondes sans
+    événement en attente (arrêt du service entre le marquage et l'enregistrement de l'événement).
+    """
+
+    name = "inventory-sync"
+
+    def __init__(self, monsters, events, player_api_url, admin_api_key,
+                 interval=2.0, batch_size=200, max_backoff=300, orphan_after=300, reconcile_interval=60):
+        super().__init__(interval, batch_size, max_backoff)
+        self.monsters = monsters
+        self.events = events
+        self.player_api_url = player_api_url
+        self.admin_api_key = admin_api_key
+        self.orphan_after = orphan_after
+        self.reconcile_interval = reconcile_interval
+        self._last_reconcile = None
+
+    def enqueue(self, owner, monster_ids):
+        """
+        Enregistre le retrait de `monster_ids` de l'inventaire de `owner` et réveille le worker.
+        """
+        now = datetime.datetime.utcnow()
+        self.events.insert_one({
+            "type": "remove",
+            "owner": owner,
+            "monster_ids": list(monster_ids),
+            "status": "pending",
+            "attempts": 0,
+            "created_at": now,
+            "next_attempt_at": now,
+        })
+        self.wake()
+
+    def drain(self):
+        """
+        Traite un lot d'événements arrivés à échéance. Retourne le nombre d'événements traités.
+        """
+        now = datetime.datetime.utcnow()
+        events = list(
+            self.events.find({"status": "pending", "next_attempt_at": {"$lte": now}})
+            .sort("next_attempt_at", 1)
+            .limit(self.batch_size)
+        )
+        if not events:
+            return 0
+
+        # Un seul retrait par joueur, tous événements confondus
+        removals = {}
+        for event in events:
+            removals.setdefault(event["owner"], set()).update(event["monster_ids"])
+        monster_ids = [monster_id for ids in removals.values() for monster_id in ids]
+
+        error = self._remove_from_inventories(removals)
+        if error is None:
+            deleted = self.monsters.delete_many({"_id": {"$in": monster_ids}, "deleted_at": {"$ne": None}}).deleted_count
+            self.events.update_many(
+                {"_id": {"$in": [event["_id"] for event in events]}},
+                {"$set": {"status": "done", "completed_at": now}, "$inc": {"attempts": 1}},
+            )
+            print(f"{deleted} monstre(s) supprimé(s), inventaire de {len(removals)} joueur(s) mis à jour.")
+            return len(events)
+
+        operations = []
+        for event in events:
+            attempts = event.get("attempts", 0) + 1
+            operations.append(UpdateOne({"_id": event["_id"]}, {"$set": {
+                "attempts": attempts,
+                "last_error": error,
+                "next_attempt_at": self.retry_at(now, attempts),
+            }}))
+        self.events.bulk_write(operations, ordered=False)
+        print(f"Échec de la mise à jour des inventaires ({len(events)} événement(s)), nouvel essai différé : {error}")
+        return len(events)
+
+    def reconcile(self):
+        """
+        Enregistre un événement pour les monstres marqués supprimés depuis longtemps et absents
+        de tout événement en attente. Retourne le nombre de monstres repris.
+        """
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=self.orphan_after)
+        orphans = {}
+        for monster in self.monsters.find({"deleted_at": {"$lte": cutoff}}, {"owner": 1}).limit(self.batch_size):
+            orphans[monster["_id"]] = monster.get("owner")
+        if not orphans:
+            return 0
+        for event in self.events.find({"status": "pending", "monster_ids": {"$in": list(orphans)}}, {"monster_ids": 1}):
+            for monster_id in event["monster_ids"]:
+                orphans.pop(monster_id, None)
+
+        by_owner = {}
+        for monster_id, owner in orphans.items():
+            by_owner.setdefault(owner, []).append(monster_id)
+        for owner, monster_ids in by_owner.items():
+            self.enqueue(owner, monster_ids)
+        if orphans:
+            print(f"Réconciliation : {len(orphans)} monstre(s) supprimé(s) sans événement repris.")
+        return len(orphans)
+
+    def stats(self):
+        oldest = self.events.find_one({"status": "pending"}, {"created_at": 1}, sort=[("created_at", 1)])
+        age = (datetime.datetime.utcnow() - oldest["created_at"]).total_seconds() if oldest else 0.0
+        return {
+            "pending": self.events.count_documents({"status": "pending"}),
+            "oldest_pending_seconds": round(age, 1),
+        }
+
+    def tick(self):
+        """
+        Réconciliation, au plus toutes les `reconcile_interval` secondes.
+        """
+        now = datetime.datetime.utcnow()
+        if self._last_reconcile is None or (now - self._last_reconcile).total_seconds() >= self.reconcile_interval:
+            self._last_reconcile = now
+            self.reconcile()
+
+    def _remove_from_inventories(self, removals):
+        """
+        Retire les monstres des inventaires en un seul appel. Retourne None en cas de succès, sinon un message d'erreur.
+        """
+        items = [{"username": owner, "monster_ids": sorted(ids)} for owner, ids in removals.items() if owner]
+        if not items:
+            return None
+        _, error = post_ndjson(f"{self.player_api_url}/admin/players/monsters/remove", items, self.admin_api_key, "PlayerAPI")
+        return error
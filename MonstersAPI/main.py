@@ -8,13 +8,28 @@
 # \__|     \__| \______/ \__|  \__|\_______/    \____/  \_______|\__|      \_______/ 
                                                                                    
 import os
-import requests
+import sys
 from flask import Flask, request, jsonify
-from pymongo import MongoClient
+from pymongo import ASCENDING, DESCENDING, MongoClient, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from bson import ObjectId
-import math
+import base64
+import binascii
+import datetime
 import json
-import random
+import threading
+
+# Modules partagés (à la racine du dépôt en local, copiés dans /app/common dans l'image Docker)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.auth_client import AuthClient
+from common.cache import TTLCache
+from common.catalog import DEFAULT_CATALOG_PATH, Catalog, catalog_response
+from common.indexes import ensure_indexes
+from common.projection import parse_fields, project
+from common.progression import MONSTER_LEVEL_UP_GAINS, experience_update_pipeline, resolve, stat_gains
+from common.rng import RngStreams
+from inventory_sync import InventorySync
+from seed_catalog import seed_catalog
 
 # Initialisation de Flask
 app = Flask(__name__)
@@ -26,28 +41,61 @@ API_PORT = int(os.getenv('API_PORT', 5002))
 PLAYER_API_URL = os.getenv('PLAYER_API_URL', 'http://localhost:5001')  # URL de l'API Player
 AUTH_API_URL = os.getenv('AUTH_API_URL', 'http://localhost:5000')
 SUMMON_API_KEY = os.getenv('SUMMON_API_KEY', 'CLE_API_TRES_SAFE')
+MAX_BATCH_IDS = int(os.getenv('MAX_BATCH_IDS', 200))  # Nombre maximal d'identifiants par lecture groupée
+ROSTER_PAGE_SIZE = int(os.getenv('ROSTER_PAGE_SIZE', 50))  # Taille de page par défaut de /monsters/mine
+ROSTER_MAX_PAGE_SIZE = int(os.getenv('ROSTER_MAX_PAGE_SIZE', 200))
+MONSTER_CACHE_TTL = float(os.getenv('MONSTER_CACHE_TTL', 60))  # Durée de vie (s) d'un monstre en cache
+MONSTER_CACHE_MAX_SIZE = int(os.getenv('MONSTER_CACHE_MAX_SIZE', 10000))
+ADMIN_API_KEY = os.getenv('ADMIN_API_KEY', 'CLE_ADMIN_TRES_SAFE')  # Clé des endpoints d'administration (PlayerAPI, /catalog/reload)
+RNG_MASTER_SEED = os.getenv('RNG_MASTER_SEED') or None  # Graine maître : noms reproductibles si définie
 
 # Connexion à la base de données MongoDB
 print(f"Connexion à MongoDB sur {DB_HOST}:{DB_PORT}...")
 client = MongoClient(f'mongodb://{DB_HOST}:{DB_PORT}/')
 db = client['monsters_db']
 monsters_collection = db['monsters']
+inventory_events_collection = db['inventory_events']  # Outbox des retraits d'inventaire vers PlayerAPI
+
+# Tris disponibles pour /monsters/mine, chacun servi par un index (owner, <champ>, _id)
+ROSTER_SORT_FIELDS = ["level", "element", "name"]
+
+INDEXES = [
+    (monsters_collection, [("owner", ASCENDING), (field, ASCENDING), ("_id", ASCENDING)], {})
+    for field in ROSTER_SORT_FIELDS
+] + [
+    (monsters_collection, [("deleted_at", ASCENDING)], {"sparse": True}),
+    (inventory_events_collection, [("status", ASCENDING), ("next_attempt_at", ASCENDING)], {}),
+    (inventory_events_collection, [("completed_at", ASCENDING)], {"expireAfterSeconds": 86400}),
+]
 
-# Chargement des monstres de base depuis un fichier JSON
-data_file_path = os.path.join(os.path.dirname(__file__), "data.json")
-if os.path.exists(data_file_path):
-    with open(data_file_path, "r") as file:
-        try:
-            data = json.load(file)
-            for monster in data:
-                monster["_id"] = str(monster["_id"])
-                if not monsters_collection.find_one({"_id": monster["_id"]}):
-                    monsters_collection.insert_one(monster)
-            print("Les données de base des monstres ont été chargées.")
-        except json.JSONDecodeError as e:
-            print(f"Erreur lors du chargement de data.json : {e}")
-else:
-    print("Erreur : Fichier data.json introuvable.")
+ensure_indexes(INDEXES)
+
+# Catalogue de base partagé avec SummonAPI (common/data.json), rechargé à chaud quand le fichier change.
+# Chaque nouvelle version est chargée en base (seed_catalog.py) en arrière-plan pour que le service
+# réponde immédiatement. CATALOG_AUTOSEED=false si le chargement est fait à part.
+CATALOG_PATH = os.getenv('CATALOG_PATH', DEFAULT_CATALOG_PATH)
+catalog = Catalog(CATALOG_PATH, poll_interval=float(os.getenv('CATALOG_POLL_INTERVAL', 5)))
+catalog_seed_lock = threading.Lock()
+
+def seed_catalog_in_background(version):
+    def run():
+        # Une seule écriture à la fois, et uniquement si la version est encore la plus récente
+        with catalog_seed_lock:
+            if catalog.current is not version:
+                return
+            try:
+                seed_catalog(monsters_collection, db['catalog_versions'], version)
+            except Exception as e:
+                print(f"Erreur lors du chargement du catalogue : {e}")
+    threading.Thread(target=run, name="catalog-seed", daemon=True).start()
+
+if os.getenv('CATALOG_AUTOSEED', 'true').lower() == 'true':
+    catalog.subscribe(seed_catalog_in_background)
+catalog.reload()
+catalog.start()
+
+# Générateurs aléatoires indépendants (déterministes si RNG_MASTER_SEED est définie)
+rng_streams = RngStreams(RNG_MASTER_SEED)
 
 # Liste de préfixes et suffixes pour générer des noms de monstres
 MONSTER_NAME_PREFIXES = [
@@ -62,28 +110,29 @@ MONSTER_NAME_SUFFIXES = [
     "force", "power", "strike", "guard", "shield", "armor", "walker", "stalker"
 ]
 
-def generate_monster_name():
+def generate_monster_name(rng):
     """
-    Génère un nom aléatoire pour un monstre en combinant un préfixe et un suffixe.
+    Génère un nom aléatoire pour un monstre en combinant un préfixe et un suffixe tirés avec `rng`.
     """
-    prefix = random.choice(MONSTER_NAME_PREFIXES)
-    suffix = random.choice(MONSTER_NAME_SUFFIXES)
+    prefix = rng.choice(MONSTER_NAME_PREFIXES)
+    suffix = rng.choice(MONSTER_NAME_SUFFIXES)
     return f"{prefix}{suffix}"
 
-# Fonction pour valider un token via AuthAPI
-def validate_token(token):
-    """
-    Valide le token auprès de l'API Auth.
-    """
-    try:
-        response = requests.post(f"{AUTH_API_URL}/validate", json={"token": token})
-        if response.status_code == 200:
-            return response.json().get("username")
-        else:
-            return None
-    except requests.exceptions.RequestException as e:
-        print(f"Erreur lors de la validation du token : {e}")
-        return None
+# Client partagé de validation des tokens (avec cache)
+auth_client = AuthClient(AUTH_API_URL)
+
+# Worker de retrait des monstres supprimés des inventaires de PlayerAPI
+inventory_sync = InventorySync(
+    monsters_collection, inventory_events_collection, PLAYER_API_URL, ADMIN_API_KEY,
+    batch_size=int(os.getenv('INVENTORY_SYNC_BATCH_SIZE', 200)),
+)
+inventory_sync.start()
+
+# Cache en lecture des monstres, clé (monster_id, owner), invalidé après chaque modification
+monster_cache = TTLCache(max_size=MONSTER_CACHE_MAX_SIZE, ttl=MONSTER_CACHE_TTL)
+
+def invalidate_monster(monster_id, owner):
+    monster_cache.pop((monster_id, owner))
 
 # Middleware pour valider le token
 @app.before_request
@@ -91,11 +140,11 @@ def verify_token():
     """
     Vérifie le token pour chaque requête (sauf health_check).
     """
-    if request.endpoint not in ['health_check', 'create_monster']:
+    if request.endpoint not in ['health_check', 'metrics', 'get_catalog', 'reload_catalog', 'create_monster', 'create_monsters_bulk', 'delete_monsters_bulk']:
         token = request.headers.get('Authorization')
         if not token:
             return jsonify({"error": "Token manquant."}), 401
-        username = validate_token(token)
+        username = auth_client.validate(token)
         if not username:
             return jsonify({"error": "Token invalide ou expiré."}), 401
         request.username = username
@@ -108,25 +157,60 @@ def health_check():
     """
     return jsonify({"message": "L'API fonctionne correctement !"}), 200
 
-# Endpoint pour créer une instance de monstre
-@app.route('/monsters', methods=['POST'])
-def create_monster():
+# Endpoint pour exposer les métriques internes du service (public)
+@app.route('/metrics', methods=['GET'])
+def metrics():
     """
-    Endpoint protégé pour créer un monstre.
-    Seules les requêtes authentifiées provenant de SummonAPI peuvent l'utiliser.
+    Retourne les compteurs des caches, l'état de la file de retraits d'inventaire et la version du catalogue.
     """
-    api_key = request.headers.get('X-API-Key')
-    if api_key != SUMMON_API_KEY:
+    return jsonify({
+        "auth_cache": auth_client.stats(),
+        "monster_cache": monster_cache.stats(),
+        "inventory_sync": inventory_sync.stats(),
+        "catalog": catalog.stats(),
+        "rng": rng_streams.stats(),
+    }), 200
+
+# Endpoint public pour récupérer le catalogue des monstres de base
+@app.route('/catalog', methods=['GET'])
+def get_catalog():
+    """
+    Retourne la version courante du catalogue avec son ETag ; 304 si le client l'a déjà (If-None-Match).
+    """
+    version = catalog.current
+    if version is None:
+        return jsonify({"error": "Catalogue indisponible."}), 503
+    return catalog_response(version)
+
+# Endpoint d'administration pour recharger le catalogue sans redémarrer le service
+@app.route('/catalog/reload', methods=['POST'])
+def reload_catalog():
+    """
+    Réservé à l'administration (header X-Admin-Key) : relit le fichier du catalogue et, s'il a changé,
+    bascule sur la nouvelle version (puis la charge en base).
+    """
+    if request.headers.get('X-Admin-Key') != ADMIN_API_KEY:
         return jsonify({"error": "Accès non autorisé."}), 403
 
-    data = request.json
-    required_fields = ["monster_type", "element", "hp", "atk", "def", "vit", "skills", "owner"]
-    if not all(field in data for field in required_fields):
-        return jsonify({"error": "Données incomplètes pour la création du monstre."}), 400
+    version, changed = catalog.reload(force=True)
+    if version is None:
+        return jsonify({"error": "Catalogue indisponible."}), 503
+    return jsonify({"version": version.version, "changed": changed, "monsters": len(version)}), 200
+
+MONSTER_REQUIRED_FIELDS = ["monster_type", "element", "hp", "atk", "def", "vit", "skills", "owner"]
 
-    new_monster = {
-        "_id": str(ObjectId()),
-        "name": generate_monster_name(),  # Ajout du nom généré
+def build_monster(data):
+    """
+    Construit le document d'un nouveau monstre (niveau 1, nom généré) à partir des données d'invocation.
+    L'identifiant peut être fourni par l'appelant (`_id`) pour rendre la création rejouable. Le nom est
+    tiré dans le flux de la clé `name_seed` fournie par SummonAPI (à défaut, de l'identifiant) : en mode
+    déterministe, une même clé donne toujours le même nom.
+    """
+    monster_id = str(data.get("_id") or ObjectId())
+    name_key = str(data.get("name_seed") or monster_id)
+    return {
+        "_id": monster_id,
+        "name": generate_monster_name(rng_streams.stream("name", name_key)),  # Ajout du nom généré
         "monster_type": data["monster_type"],
         "element": data["element"],
         "hp": data["hp"],
@@ -140,61 +224,318 @@ def create_monster():
         "skill_points": 0,
     }
 
-    monsters_collection.insert_one(new_monster)
+# Endpoint pour créer une instance de monstre
+@app.route('/monsters', methods=['POST'])
+def create_monster():
+    """
+    Endpoint protégé pour créer un monstre.
+    Seules les requêtes authentifiées provenant de SummonAPI peuvent l'utiliser.
+    """
+    api_key = request.headers.get('X-API-Key')
+    if api_key != SUMMON_API_KEY:
+        return jsonify({"error": "Accès non autorisé."}), 403
+
+    data = request.json
+    if not all(field in data for field in MONSTER_REQUIRED_FIELDS):
+        return jsonify({"error": "Données incomplètes pour la création du monstre."}), 400
+
+    new_monster = build_monster(data)
+    try:
+        monsters_collection.insert_one(new_monster)
+    except DuplicateKeyError:
+        # Création rejouée avec le même identifiant : le monstre existe déjà
+        print(f"Monstre {new_monster['_id']} déjà créé.")
     return jsonify({"id": new_monster["_id"], "message": "Monstre créé avec succès."}), 201
 
+# Endpoint pour créer plusieurs monstres en une fois
+@app.route('/monsters/bulk', methods=['POST'])
+def create_monsters_bulk():
+    """
+    Endpoint protégé (SummonAPI) pour créer plusieurs monstres en un seul insert_many :
+    corps {"owner": ..., "monsters": [données d'invocation, ...]} (un monstre peut préciser son propre owner).
+    Les monstres dont l'identifiant (`_id`) existe déjà sont ignorés, ce qui rend l'appel rejouable.
+    Retourne les monstres créés, dans l'ordre de la requête.
+    """
+    if request.headers.get('X-API-Key') != SUMMON_API_KEY:
+        return jsonify({"error": "Accès non autorisé."}), 403
+
+    data = request.get_json(silent=True) or {}
+    owner, monsters = data.get("owner"), data.get("monsters")
+    if not isinstance(monsters, list) or not monsters or not all(isinstance(monster, dict) for monster in monsters):
+        return jsonify({"error": "Une liste de monstres est requise."}), 400
+    if len(monsters) > MAX_BATCH_IDS:
+        return jsonify({"error": f"Au plus {MAX_BATCH_IDS} monstres par requête."}), 400
+    monsters = [dict({"owner": owner}, **monster) for monster in monsters]
+    if not all(monster["owner"] and all(field in monster for field in MONSTER_REQUIRED_FIELDS) for monster in monsters):
+        return jsonify({"error": "Données incomplètes pour la création des monstres."}), 400
+
+    new_monsters = [build_monster(monster) for monster in monsters]
+    try:
+        monsters_collection.insert_many(new_monsters, ordered=False)
+    except BulkWriteError as e:
+        if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+            print(f"Erreur lors de la création en masse des monstres : {e.details}")
+            return jsonify({"error": "Erreur lors de la création des monstres."}), 500
+        # Création rejouée : les documents déjà présents font foi (nom généré lors du premier essai)
+        stored = {monster["_id"]: monster for monster in monsters_collection.find({"_id": {"$in": [m["_id"] for m in new_monsters]}})}
+        new_monsters = [stored.get(monster["_id"], monster) for monster in new_monsters]
+    print(f"{len(new_monsters)} monstre(s) créé(s).")
+    return jsonify({"monsters": new_monsters, "message": "Monstres créés avec succès."}), 201
+
+# Endpoint pour annuler une création groupée
+@app.route('/monsters/bulk/delete', methods=['POST'])
+def delete_monsters_bulk():
+    """
+    Endpoint protégé (SummonAPI) pour supprimer définitivement des monstres créés par une invocation abandonnée :
+    corps {"monsters": [{"_id": ..., "owner": ...}, ...]}. Seuls les monstres appartenant à l'owner indiqué
+    sont supprimés ; les identifiants absents sont ignorés, ce qui rend l'appel rejouable.
+    """
+    if request.headers.get('X-API-Key') != SUMMON_API_KEY:
+        return jsonify({"error": "Accès non autorisé."}), 403
+
+    data = request.get_json(silent=True) or {}
+    monsters = data.get("monsters")
+    if not isinstance(monsters, list) or not all(
+        isinstance(monster, dict) and isinstance(monster.get("_id"), str) and monster.get("owner") for monster in monsters
+    ):
+        return jsonify({"error": "Une liste de monstres (_id, owner) est requise."}), 400
+    if len(monsters) > MAX_BATCH_IDS:
+        return jsonify({"error": f"Au plus {MAX_BATCH_IDS} monstres par requête."}), 400
+
+    by_owner = {}
+    for monster in monsters:
+        by_owner.setdefault(monster["owner"], []).append(monster["_id"])
+    deleted = 0
+    if by_owner:
+        deleted = monsters_collection.delete_many({"$or": [
+            {"_id": {"$in": monster_ids}, "owner": owner} for owner, monster_ids in by_owner.items()
+        ]}).deleted_count
+    for owner, monster_ids in by_owner.items():
+        for monster_id in monster_ids:
+            invalidate_monster(monster_id, owner)
+    print(f"{deleted} monstre(s) d'invocations abandonnées supprimé(s).")
+    return jsonify({"deleted": deleted, "message": "Monstres supprimés avec succès."}), 200
+
 # Endpoint pour supprimer un monstre
 @app.route('/monsters/<monster_id>', methods=['DELETE'])
 def delete_monster(monster_id):
     """
-    Supprime un monstre de la base de données et de l'inventaire du joueur.
+    Supprime un monstre de l'utilisateur : le monstre est marqué supprimé et disparaît immédiatement
+    des lectures ; le retrait de l'inventaire du joueur et la suppression définitive sont asynchrones.
     """
+    username = request.username
     print(f"Requête reçue pour supprimer le monstre {monster_id}.")
 
-    # Récupérer le monstre dans la base de données
-    monster = monsters_collection.find_one({"_id": monster_id})
+    monster = monsters_collection.find_one_and_update(
+        {"_id": monster_id, "owner": username, "deleted_at": None},
+        {"$set": {"deleted_at": datetime.datetime.utcnow()}},
+        projection={"_id": 1},
+    )
     if not monster:
-        print(f"Erreur : Monstre {monster_id} introuvable.")
-        return jsonify({"error": "Monstre introuvable."}), 404
-
-    # Si le monstre appartient à un joueur, le retirer de son inventaire via PlayerAPI
-    owner = monster.get("owner")
-    if owner:
-        print(f"Monstre {monster_id} appartient à {owner}. Tentative de suppression de l'inventaire.")
-        try:
-            response = requests.delete(
-                f"{PLAYER_API_URL}/player/monsters/{monster_id}",
-                headers={"Authorization": request.headers.get("Authorization")},
-            )
-            if response.status_code != 200:
-                print(f"Erreur lors de la suppression du monstre dans PlayerAPI : {response.text}")
-                return jsonify({"error": "Impossible de supprimer le monstre de l'inventaire du joueur."}), 500
-        except requests.exceptions.RequestException as e:
-            print(f"Erreur de communication avec PlayerAPI : {e}")
-            return jsonify({"error": "Erreur de communication avec PlayerAPI."}), 500
-
-    # Supprimer le monstre de la base de données MonstersAPI
-    result = monsters_collection.delete_one({"_id": monster_id})
-    if result.deleted_count == 0:
         print(f"Erreur : Monstre {monster_id} introuvable ou déjà supprimé.")
         return jsonify({"error": "Monstre introuvable ou déjà supprimé."}), 404
+    invalidate_monster(monster_id, username)
+    inventory_sync.enqueue(username, [monster_id])
 
     print(f"Monstre {monster_id} supprimé avec succès.")
     return jsonify({"message": "Monstre supprimé avec succès."}), 200
 
+# Endpoint pour relâcher plusieurs monstres en une fois
+@app.route('/monsters/release', methods=['POST'])
+def release_monsters():
+    """
+    Supprime plusieurs monstres de l'utilisateur : corps {"ids": [...]}.
+    Une seule vérification de propriété (`$in`), un seul marquage et un seul événement de retrait d'inventaire ;
+    le résultat est détaillé par identifiant.
+    """
+    username = request.username
+    data = request.get_json(silent=True) or {}
+    monster_ids = data.get("ids")
+    if not isinstance(monster_ids, list) or not all(isinstance(monster_id, str) for monster_id in monster_ids):
+        return jsonify({"error": "Une liste d'identifiants de monstres est requise."}), 400
+    if len(monster_ids) > MAX_BATCH_IDS:
+        return jsonify({"error": f"Au plus {MAX_BATCH_IDS} identifiants par requête."}), 400
+    monster_ids = list(dict.fromkeys(monster_ids))
+
+    owned = [
+        monster["_id"]
+        for monster in monsters_collection.find({"_id": {"$in": monster_ids}, "owner": username, "deleted_at": None}, {"_id": 1})
+    ]
+    released = []
+    if owned:
+        now = datetime.datetime.utcnow()
+        result = monsters_collection.update_many(
+            {"_id": {"$in": owned}, "owner": username, "deleted_at": None},
+            {"$set": {"deleted_at": now}},
+        )
+        if result.modified_count == len(owned):
+            released = owned
+        else:
+            # Suppressions concurrentes : seuls les monstres marqués par cette requête sont relâchés ici
+            released = [monster["_id"] for monster in monsters_collection.find({"_id": {"$in": owned}, "deleted_at": now}, {"_id": 1})]
+        for monster_id in released:
+            invalidate_monster(monster_id, username)
+        if released:
+            inventory_sync.enqueue(username, released)
+
+    released_set = set(released)
+    failed = [
+        {"id": monster_id, "error": "Monstre introuvable, déjà supprimé ou non associé à l'utilisateur."}
+        for monster_id in monster_ids if monster_id not in released_set
+    ]
+    print(f"{len(released)} monstre(s) relâché(s) par {username}, {len(failed)} échec(s).")
+    return jsonify({"released": released, "failed": failed}), 200
+
+def fetch_monsters_batch(monster_ids, username, projection=None):
+    """
+    Lit plusieurs monstres de l'utilisateur en une seule requête `$in`, limitée aux champs de `projection`.
+    Retourne (monstres dans l'ordre demandé, identifiants introuvables ou non associés à l'utilisateur).
+    """
+    # Doublons ignorés en conservant l'ordre de la première occurrence
+    monster_ids = list(dict.fromkeys(monster_ids))
+    found = {
+        monster["_id"]: monster
+        for monster in monsters_collection.find({"_id": {"$in": monster_ids}, "owner": username, "deleted_at": None}, projection)
+    }
+    monsters = [found[monster_id] for monster_id in monster_ids if monster_id in found]
+    missing = [monster_id for monster_id in monster_ids if monster_id not in found]
+    return monsters, missing
+
+def batch_response(monster_ids):
+    """
+    Valide une liste d'identifiants et renvoie la réponse de lecture groupée.
+    """
+    if not isinstance(monster_ids, list) or not all(isinstance(monster_id, str) for monster_id in monster_ids):
+        return jsonify({"error": "Une liste d'identifiants de monstres est requise."}), 400
+    if len(monster_ids) > MAX_BATCH_IDS:
+        return jsonify({"error": f"Au plus {MAX_BATCH_IDS} identifiants par requête."}), 400
+    try:
+        projection = parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    monsters, missing = fetch_monsters_batch(monster_ids, request.username, projection)
+    return jsonify({"monsters": monsters, "missing": missing}), 200
+
+# Endpoint pour obtenir plusieurs monstres (identifiants séparés par des virgules)
+@app.route('/monsters', methods=['GET'])
+def get_monsters():
+    """
+    Récupère plusieurs monstres de l'utilisateur : GET /monsters?ids=<id1>,<id2>,...&fields=name,level
+    """
+    ids = request.args.get('ids', '')
+    return batch_response([monster_id for monster_id in ids.split(',') if monster_id])
+
+# Endpoint pour obtenir plusieurs monstres (forme POST pour les longues listes)
+@app.route('/monsters/batch', methods=['POST'])
+def get_monsters_batch():
+    """
+    Récupère plusieurs monstres de l'utilisateur : corps {"ids": [...]}, champs via ?fields=.
+    """
+    data = request.get_json(silent=True) or {}
+    return batch_response(data.get('ids'))
+
+def encode_cursor(sort_value, monster_id):
+    return base64.urlsafe_b64encode(json.dumps([sort_value, monster_id]).encode()).decode()
+
+def decode_cursor(cursor):
+    """
+    Retourne (valeur du champ de tri, _id) du dernier monstre de la page précédente ; lève ValueError si le curseur est invalide.
+    """
+    try:
+        sort_value, monster_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise ValueError("Curseur invalide.")
+    if not isinstance(monster_id, str):
+        raise ValueError("Curseur invalide.")
+    return sort_value, monster_id
+
+# Endpoint pour lister les monstres de l'utilisateur (pagination par curseur)
+@app.route('/monsters/mine', methods=['GET'])
+def list_my_monsters():
+    """
+    Liste les monstres de l'utilisateur, page par page.
+    Paramètres : sort (level, element, name), order (asc, desc), limit, cursor (renvoyé par la page précédente),
+    fields (champs à renvoyer, séparés par des virgules).
+    """
+    username = request.username
+    sort_field = request.args.get('sort', 'level')
+    if sort_field not in ROSTER_SORT_FIELDS:
+        return jsonify({"error": f"Tri invalide, valeurs possibles : {', '.join(ROSTER_SORT_FIELDS)}."}), 400
+    order = request.args.get('order', 'desc' if sort_field == 'level' else 'asc')
+    if order not in ('asc', 'desc'):
+        return jsonify({"error": "Ordre invalide, valeurs possibles : asc, desc."}), 400
+    try:
+        limit = int(request.args.get('limit', ROSTER_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"error": "Le paramètre limit doit être un entier."}), 400
+    limit = max(1, min(limit, ROSTER_MAX_PAGE_SIZE))
+
+    try:
+        projection = parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if projection is not None:
+        # Le champ de tri est nécessaire pour construire le curseur de la page suivante
+        projection[sort_field] = 1
+
+    # Reprise strictement après le dernier monstre renvoyé, à l'aide de l'index (owner, <champ>, _id)
+    query = {"owner": username, "deleted_at": None}
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            last_value, last_id = decode_cursor(cursor)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        operator = "$gt" if order == 'asc' else "$lt"
+        query["$or"] = [
+            {sort_field: {operator: last_value}},
+            {sort_field: last_value, "_id": {operator: last_id}},
+        ]
+
+    direction = ASCENDING if order == 'asc' else DESCENDING
+    # Une entrée de plus que la page pour savoir s'il reste des monstres
+    monsters = list(
+        monsters_collection.find(query, projection)
+        .sort([(sort_field, direction), ("_id", direction)])
+        .limit(limit + 1)
+    )
+    next_cursor = None
+    if len(monsters) > limit:
+        monsters = monsters[:limit]
+        last = monsters[-1]
+        next_cursor = encode_cursor(last.get(sort_field), last["_id"])
+
+    return jsonify({"monsters": monsters, "next_cursor": next_cursor}), 200
 
 # Endpoint pour obtenir les informations d'un monstre
 @app.route('/monsters/<monster_id>', methods=['GET'])
 def get_monster(monster_id):
     """
-    Récupère les informations d'un monstre spécifique.
+    Récupère les informations d'un monstre spécifique (ou seulement les champs de ?fields=).
     """
     username = request.username
-    monster = monsters_collection.find_one({"_id": monster_id, "owner": username})
+    try:
+        projection = parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    key = (monster_id, username)
+    monster = monster_cache.get(key)
+    if monster is not None:
+        return jsonify(project(monster, projection)), 200
+
+    # Lecture partielle : seuls les champs demandés sont lus, le document n'est pas mis en cache.
+    # Le numéro d'invalidation est relevé avant la lecture : si le monstre est modifié pendant celle-ci,
+    # l'ancien document n'est pas remis en cache.
+    generation = monster_cache.generation()
+    monster = monsters_collection.find_one({"_id": monster_id, "owner": username, "deleted_at": None}, projection)
     if not monster:
         return jsonify({"error": "Monstre introuvable ou non associé à l'utilisateur."}), 404
-
     monster["_id"] = str(monster["_id"])
+    if projection is None:
+        monster_cache.set(key, monster, generation=generation)
+
     return jsonify(monster), 200
 
 # Endpoint pour ajouter de l'expérience à un monstre
@@ -207,28 +548,107 @@ def add_experience(monster_id):
     data = request.json
     experience_gain = data.get('experience', 0)
 
-    if experience_gain <= 0:
+    if not isinstance(experience_gain, (int, float)) or experience_gain <= 0:
         return jsonify({"error": "Un gain d'expérience positif est requis."}), 400
 
-    monster = monsters_collection.find_one({"_id": monster_id, "owner": username})
+    # Montée de niveau appliquée en une seule mise à jour atomique (table de progression partagée).
+    # L'état précédent est renvoyé pour recalculer localement le résultat, identique à celui écrit en base.
+    monster = monsters_collection.find_one_and_update(
+        {"_id": monster_id, "owner": username, "deleted_at": None},
+        experience_update_pipeline(experience_gain, per_level_gains=MONSTER_LEVEL_UP_GAINS),
+        return_document=ReturnDocument.BEFORE,
+    )
     if not monster:
         return jsonify({"error": "Monstre introuvable ou non associé à l'utilisateur."}), 404
+    invalidate_monster(monster_id, username)
+
+    progress = resolve(monster["level"], monster["experience"], experience_gain)
+    monster["level"], monster["experience"] = progress.level, progress.experience
+    for stat, gain in stat_gains(progress.levels_gained).items():
+        monster[stat] = monster.get(stat, 0) + gain
 
-    monster["experience"] += experience_gain
-    level_up_threshold = 50 * math.pow(1.1, monster["level"])
+    return jsonify({"message": "Expérience ajoutée.", "monster": monster, "levels_gained": progress.levels_gained}), 200
 
-    while monster["experience"] >= level_up_threshold:
-        monster["level"] += 1
-        monster["experience"] -= level_up_threshold
-        monster["skill_points"] += 1
-        monster["hp"] += 10
-        monster["atk"] += 5
-        monster["def"] += 3
-        monster["vit"] += 2
-        level_up_threshold = 50 * math.pow(1.1, monster["level"])
+# Gains par niveau de compétence
+SKILL_DMG_PER_LEVEL = 10
+SKILL_RATIO_PER_LEVEL = 2
 
-    monsters_collection.update_one({"_id": monster_id}, {"$set": monster})
-    return jsonify({"message": "Expérience ajoutée.", "monster": monster}), 200
+def parse_skill_upgrades(upgrades):
+    """
+    Valide une liste [{"skill": numéro (à partir de 1), "levels": niveaux}, ...].
+    Retourne un dict {index de la compétence: niveaux} (doublons cumulés) ; lève ValueError si la liste est invalide.
+    """
+    if not isinstance(upgrades, list) or not upgrades:
+        raise ValueError("Une liste d'améliorations est requise.")
+    levels_by_index = {}
+    for upgrade in upgrades:
+        skill_num = upgrade.get("skill") if isinstance(upgrade, dict) else None
+        levels = upgrade.get("levels", 1) if isinstance(upgrade, dict) else None
+        if type(skill_num) is not int or skill_num < 1 or type(levels) is not int or levels < 1:
+            raise ValueError("Chaque amélioration doit avoir un numéro de compétence et un nombre de niveaux positifs.")
+        levels_by_index[skill_num - 1] = levels_by_index.get(skill_num - 1, 0) + levels
+    return levels_by_index
+
+def skill_upgrade_update(levels_by_index):
+    """
+    Filtre et pipeline de mise à jour appliquant toutes les améliorations en une seule écriture conditionnelle :
+    le filtre garantit assez de points et aucun dépassement de niveau maximum, sinon rien n'est modifié.
+    """
+    def skill_at(index):
+        return {"$arrayElemAt": ["$skills", index]}
+
+    def new_level(skill, levels):
+        return {"$add": [{"$ifNull": [f"{skill}.level", 1]}, levels]}
+
+    # Pour chaque compétence ciblée : niveau actuel + niveaux demandés <= niveau maximum
+    # (une compétence inexistante donne un niveau maximum nul, donc un refus)
+    guard = {"$and": [
+        {"$let": {"vars": {"s": skill_at(index)}, "in": {"$lte": [new_level("$$s", levels), "$$s.lvlMax"]}}}
+        for index, levels in levels_by_index.items()
+    ]}
+    upgraded_skills = {"$map": {
+        "input": {"$range": [0, {"$size": "$skills"}]},
+        "as": "i",
+        "in": {"$let": {
+            "vars": {"s": {"$arrayElemAt": ["$skills", "$$i"]}, "levels": {"$switch": {
+                "branches": [{"case": {"$eq": ["$$i", index]}, "then": levels} for index, levels in levels_by_index.items()],
+                "default": 0,
+            }}},
+            "in": {"$cond": [{"$eq": ["$$levels", 0]}, "$$s", {"$mergeObjects": ["$$s", {
+                "level": new_level("$$s", "$$levels"),
+                "dmg": {"$add": ["$$s.dmg", {"$multiply": [SKILL_DMG_PER_LEVEL, "$$levels"]}]},
+                "ratio": {"$mergeObjects": ["$$s.ratio", {
+                    "percent": {"$add": ["$$s.ratio.percent", {"$multiply": [SKILL_RATIO_PER_LEVEL, "$$levels"]}]},
+                }]},
+            }]}]},
+        }},
+    }}
+    total_points = sum(levels_by_index.values())
+    query = {"skill_points": {"$gte": total_points}, "$expr": guard}
+    pipeline = [{"$set": {"skills": upgraded_skills, "skill_points": {"$subtract": ["$skill_points", total_points]}}}]
+    return query, pipeline
+
+def upgrade_skills(monster_id, username, levels_by_index):
+    """
+    Applique les améliorations de façon atomique. Retourne (monstre mis à jour, None, 200) ou (None, erreur, code HTTP).
+    """
+    query, pipeline = skill_upgrade_update(levels_by_index)
+    query.update({"_id": monster_id, "owner": username, "deleted_at": None})
+    monster = monsters_collection.find_one_and_update(query, pipeline, return_document=ReturnDocument.AFTER)
+    if monster:
+        invalidate_monster(monster_id, username)
+        return monster, None, 200
+
+    # Aucune écriture : relecture pour expliquer le refus
+    monster = monsters_collection.find_one({"_id": monster_id, "owner": username, "deleted_at": None}, {"skills": 1, "skill_points": 1})
+    if not monster:
+        return None, "Monstre introuvable ou n'appartient pas à l'utilisateur.", 404
+    skills = monster.get("skills", [])
+    if any(index >= len(skills) for index in levels_by_index):
+        return None, "Numéro de compétence invalide.", 400
+    if monster.get("skill_points", 0) < sum(levels_by_index.values()):
+        return None, "Pas assez de points de compétence disponibles.", 400
+    return None, "Niveau maximum atteint pour cette compétence.", 400
 
 # Endpoint pour utiliser un point de compétence
 @app.route('/monsters/<monster_id>/skills/<int:skill_num>', methods=['PUT'])
@@ -238,40 +658,42 @@ def use_skill_point(monster_id, skill_num):
     """
     username = request.username
     print(f"Requête reçue pour améliorer la compétence {skill_num} du monstre {monster_id} par {username}.")
-
-    # Vérifier si le monstre appartient à l'utilisateur
-    monster = monsters_collection.find_one({"_id": monster_id, "owner": username})
-    if not monster:
-        print(f"Erreur : Monstre {monster_id} introuvable ou n'appartient pas à l'utilisateur.")
-        return jsonify({"error": "Monstre introuvable ou n'appartient pas à l'utilisateur."}), 404
-
-    if monster["skill_points"] <= 0:
-        print("Erreur : Pas de points de compétence disponibles.")
-        return jsonify({"error": "Pas de points de compétence disponibles."}), 400
-
-    # Vérifier que le numéro de compétence est valide
-    skills = monster.get("skills", [])
-    if skill_num < 1 or skill_num > len(skills):
-        print(f"Erreur : Compétence {skill_num} invalide.")
+    if skill_num < 1:
         return jsonify({"error": "Numéro de compétence invalide."}), 400
 
-    skill = skills[skill_num - 1]
-    if skill["lvlMax"] <= skill.get("level", 1):
-        print(f"Erreur : Compétence {skill_num} a atteint son niveau maximum.")
-        return jsonify({"error": "Niveau maximum atteint pour cette compétence."}), 400
-
-    # Améliorer la compétence
-    skill["level"] = skill.get("level", 1) + 1
-    skill["dmg"] += 10  # Exemple d'augmentation des dégâts de base
-    skill["ratio"]["percent"] += 2  # Exemple d'augmentation du ratio
-    monster["skill_points"] -= 1
+    monster, error, code = upgrade_skills(monster_id, username, {skill_num - 1: 1})
+    if error:
+        print(f"Erreur lors de l'amélioration de la compétence {skill_num} du monstre {monster_id} : {error}")
+        return jsonify({"error": error}), code
 
-    # Mise à jour dans la base de données
-    monsters_collection.update_one({"_id": monster_id}, {"$set": {"skills": skills, "skill_points": monster["skill_points"]}})
     print(f"Compétence {skill_num} du monstre {monster_id} améliorée avec succès.")
     return jsonify({"message": "Compétence améliorée avec succès.", "monster": monster}), 200
 
+# Endpoint pour appliquer plusieurs améliorations de compétences en une fois
+@app.route('/monsters/<monster_id>/skills', methods=['PUT'])
+def upgrade_skills_batch(monster_id):
+    """
+    Applique un lot d'améliorations {"upgrades": [{"skill": 1, "levels": 2}, ...]} en une seule écriture :
+    soit toutes les améliorations sont appliquées, soit aucune.
+    """
+    username = request.username
+    data = request.get_json(silent=True) or {}
+    try:
+        levels_by_index = parse_skill_upgrades(data.get("upgrades"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    monster, error, code = upgrade_skills(monster_id, username, levels_by_index)
+    if error:
+        print(f"Erreur lors de l'amélioration des compétences du monstre {monster_id} : {error}")
+        return jsonify({"error": error}), code
+
+    print(f"{sum(levels_by_index.values())} point(s) de compétence dépensé(s) sur le monstre {monster_id}.")
+    return jsonify({"message": "Compétences améliorées avec succès.", "monster": monster}), 200
+
 # Point d'entrée de l'application
 if __name__ == '__main__':
     print(f"Démarrage de MonstersAPI sur le port {API_PORT}...")
-    app.run(host='0.0.0.0', port=API_PORT, debug=True)
+    # Sans rechargeur : le processus parent de Werkzeug importerait aussi le module et lancerait
+    # une seconde fois les workers en arrière-plan sur les mêmes collections
+    app.run(host='0.0.0.0', port=API_PORT, debug=True, use_reloader=False)
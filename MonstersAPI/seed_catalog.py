@@ -0,0 +1,64 @@
+"""
+Chargement versionné du catalogue de monstres de base (common/data.json) dans la base de MonstersAPI.
+
+La version est l'empreinte SHA-256 du contenu du catalogue (common/catalog.py) : si elle est déjà enregistrée dans
+`catalog_versions`, rien n'est fait. Sinon toutes les entrées sont écrites en un seul bulk_write
+d'upserts, puis la version est enregistrée. L'opération est idempotente et peut être lancée
+par plusieurs instances à la fois. Exemple :
+    python seed_catalog.py --path ../common/data.json
+"""
+import argparse
+import datetime
+import os
+import sys
+
+from pymongo import MongoClient, UpdateOne
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.catalog import DEFAULT_CATALOG_PATH, Catalog, content_hash
+
+
+def seed_catalog(collection, versions_collection, catalog_version):
+    """
+    Charge la version `catalog_version` (common.catalog.CatalogVersion) dans `collection`
+    si elle n'a pas déjà été chargée. Retourne l'empreinte de la version.
+    """
+    version = catalog_version.version
+    if versions_collection.find_one({"_id": version}, {"_id": 1}):
+        print(f"Catalogue déjà chargé (version {version[:12]}).")
+        return version
+
+    operations = []
+    for monster in catalog_version.monsters:
+        monster = dict(monster, _id=str(monster["_id"]))
+        monster["catalog_hash"] = content_hash(monster)
+        operations.append(UpdateOne({"_id": monster["_id"]}, {"$set": monster}, upsert=True))
+    if operations:
+        result = collection.bulk_write(operations, ordered=False)
+        print(f"Catalogue version {version[:12]} chargé : {result.upserted_count} ajout(s), "
+              f"{result.modified_count} mise(s) à jour.")
+
+    versions_collection.update_one(
+        {"_id": version},
+        {"$setOnInsert": {"entries": len(operations), "loaded_at": datetime.datetime.now()}},
+        upsert=True,
+    )
+    return version
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chargement du catalogue de monstres de base.")
+    parser.add_argument("--path", default=os.getenv("CATALOG_PATH", DEFAULT_CATALOG_PATH))
+    parser.add_argument("--db-host", default=os.getenv("DB_HOST", "localhost"))
+    parser.add_argument("--db-port", type=int, default=int(os.getenv("DB_PORT", 27017)))
+    args = parser.parse_args()
+
+    catalog_version, _ = Catalog(args.path).reload()
+    if catalog_version is None:
+        sys.exit(1)
+    db = MongoClient(f"mongodb://{args.db_host}:{args.db_port}/")["monsters_db"]
+    seed_catalog(db["monsters"], db["catalog_versions"], catalog_version)
+
+
+if __name__ == '__main__':
+    main()
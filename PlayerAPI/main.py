@@ -11,10 +11,18 @@
 #                          \______/                     
 
 import os
+import sys
 import requests
 from flask import Flask, request, jsonify
-from pymongo import MongoClient
-import math
+from pymongo import MongoClient, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+# Modules partagés (à la racine du dépôt en local, copiés dans /app/common dans l'image Docker)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.auth_client import AuthClient
+from common.ndjson import chunked, parse_ndjson
+from common.projection import parse_fields
+from common.progression import experience_update_pipeline, resolve
 
 # Initialisation de l'application Flask
 app = Flask(__name__)
@@ -25,6 +33,8 @@ DB_PORT = int(os.getenv('DB_PORT', 27017))
 API_PORT = int(os.getenv('API_PORT', 5001))
 AUTH_API_URL = os.getenv('AUTH_API_URL', 'http://localhost:5000')  # URL de l'API Auth
 MONSTERS_API_URL = os.getenv('MONSTERS_API_URL', 'http://localhost:5002')  # URL de l'API Monsters
+ADMIN_API_KEY = os.getenv('ADMIN_API_KEY', 'CLE_ADMIN_TRES_SAFE')  # Clé des endpoints d'administration
+BULK_CHUNK_SIZE = int(os.getenv('BULK_CHUNK_SIZE', 1000))  # Taille des lots d'écriture en masse
 
 # Connexion à la base de données MongoDB
 print(f"Connexion à MongoDB sur {DB_HOST}:{DB_PORT}...")
@@ -32,22 +42,14 @@ client = MongoClient(f'mongodb://{DB_HOST}:{DB_PORT}/')
 db = client['player_db']
 players_collection = db['players']
 
-# Fonction pour valider le token en appelant l'API Auth
-def validate_token(token):
-    """
-    Valide le token en appelant l'API Auth.
-    Retourne le nom d'utilisateur si le token est valide, sinon une erreur.
-    """
-    print("Validation du token auprès de l'API Auth...")
-    try:
-        response = requests.post(f"{AUTH_API_URL}/validate", json={"token": token})
-        if response.status_code == 200:
-            return response.json().get("username")
-        else:
-            return None
-    except requests.exceptions.RequestException as e:
-        print(f"Erreur lors de la validation du token : {e}")
-        return None
+# Un seul joueur par utilisateur (nécessaire aux créations idempotentes en masse)
+try:
+    players_collection.create_index("username", unique=True)
+except Exception as e:
+    print(f"Erreur lors de la création de l'index unique sur username : {e}")
+
+# Client partagé de validation des tokens (avec cache)
+auth_client = AuthClient(AUTH_API_URL)
 
 # Middleware pour vérifier le token
 @app.before_request
@@ -55,12 +57,12 @@ def check_authentication():
     """
     Vérifie le token avant chaque requête.
     """
-    if request.endpoint != 'health_check':  # Exclure les endpoints publics
+    if request.endpoint not in ['health_check', 'metrics', 'bulk_create_players', 'bulk_remove_monsters', 'bulk_add_monsters']:  # Exclure les endpoints publics et d'administration
         token = request.headers.get('Authorization')
         if not token:
             return jsonify({"error": "Token manquant dans les headers."}), 401
 
-        username = validate_token(token)
+        username = auth_client.validate(token)
         if not username:
             return jsonify({"error": "Token invalide ou expiré."}), 401
 
@@ -75,6 +77,14 @@ def health_check():
     """
     return jsonify({"message": "L'API fonctionne correctement !"}), 200
 
+# Endpoint pour exposer les métriques internes du service (public)
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Retourne les compteurs du cache de validation des tokens.
+    """
+    return jsonify({"auth_cache": auth_client.stats()}), 200
+
 # Endpoint pour créer le joueur
 @app.route('/player', methods=['POST'])
 def create_player():
@@ -97,7 +107,12 @@ def create_player():
         "monsters": [],  # Liste vide de monstres
         "max_monsters": 11  # Capacité initiale des monstres (10 + niveau 1)
     }
-    result = players_collection.insert_one(player)
+    try:
+        result = players_collection.insert_one(player)
+    except DuplicateKeyError:
+        # Création concurrente (worker de provisionnement d'AuthAPI) : l'index unique a tranché
+        print(f"Erreur : Le joueur {username} existe déjà.")
+        return jsonify({"error": "Joueur déjà existant."}), 409
 
     # Ajoute l'ID du joueur sous forme de chaîne pour éviter les problèmes de sérialisation
     player["_id"] = str(result.inserted_id)
@@ -105,15 +120,135 @@ def create_player():
     print(f"Joueur {username} créé avec succès.")
     return jsonify({"message": "Joueur créé avec succès.", "player": player}), 201
 
+# Endpoint d'administration pour créer des joueurs en masse
+@app.route('/admin/players/bulk', methods=['POST'])
+def bulk_create_players():
+    """
+    Réservé à l'administration et à AuthAPI (header X-Admin-Key).
+    Corps NDJSON, une ligne par joueur : username, level (optionnel), experience (optionnel).
+    Les joueurs déjà existants ne sont pas modifiés, ce qui rend l'appel rejouable.
+    """
+    if request.headers.get('X-Admin-Key') != ADMIN_API_KEY:
+        return jsonify({"error": "Accès non autorisé."}), 403
+
+    try:
+        entries = parse_ndjson(request.get_data(as_text=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    operations = []
+    for line_number, entry in enumerate(entries, start=1):
+        username = entry.get("username")
+        level, experience = entry.get("level", 1), entry.get("experience", 0)
+        if not username or not isinstance(level, int) or level < 1 or not isinstance(experience, int) or experience < 0:
+            return jsonify({"error": f"Entrée {line_number} invalide."}), 400
+        operations.append(UpdateOne({"username": username}, {"$setOnInsert": {
+            "username": username,
+            "level": level,
+            "experience": experience,
+            "monsters": [],
+            "max_monsters": 10 + level,
+        }}, upsert=True))
+
+    created = 0
+    for chunk in chunked(operations, BULK_CHUNK_SIZE):
+        try:
+            created += players_collection.bulk_write(chunk, ordered=False).upserted_count
+        except BulkWriteError as e:
+            # Doublons dus à des créations concurrentes : le joueur existe, c'est le résultat attendu
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                print(f"Erreur lors de la création en masse des joueurs : {e.details}")
+                return jsonify({"error": "Erreur lors de la création des joueurs."}), 500
+            created += e.details.get("nUpserted", 0)
+
+    print(f"Création en masse : {created} joueur(s) créé(s), {len(operations) - created} déjà existant(s).")
+    return jsonify({"created": created, "existing": len(operations) - created}), 200
+
+# Endpoint d'administration pour retirer des monstres de plusieurs inventaires
+@app.route('/admin/players/monsters/remove', methods=['POST'])
+def bulk_remove_monsters():
+    """
+    Réservé aux services internes (header X-Admin-Key), utilisé par MonstersAPI après une suppression
+    et par SummonAPI pour libérer les places réservées par une invocation abandonnée.
+    Corps NDJSON, une ligne par joueur : username, monster_ids. Un seul `$pullAll` par joueur ;
+    les monstres déjà absents sont ignorés, ce qui rend l'appel rejouable.
+    """
+    if request.headers.get('X-Admin-Key') != ADMIN_API_KEY:
+        return jsonify({"error": "Accès non autorisé."}), 403
+
+    try:
+        entries = parse_ndjson(request.get_data(as_text=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    operations = []
+    for line_number, entry in enumerate(entries, start=1):
+        username, monster_ids = entry.get("username"), entry.get("monster_ids")
+        if not username or not isinstance(monster_ids, list):
+            return jsonify({"error": f"Entrée {line_number} invalide."}), 400
+        operations.append(UpdateOne({"username": username}, {"$pullAll": {"monsters": monster_ids}}))
+
+    modified = 0
+    for chunk in chunked(operations, BULK_CHUNK_SIZE):
+        modified += players_collection.bulk_write(chunk, ordered=False).modified_count
+
+    print(f"Retrait en masse : {modified} inventaire(s) modifié(s) sur {len(operations)}.")
+    return jsonify({"modified": modified}), 200
+
+# Endpoint d'administration pour ajouter des monstres à plusieurs inventaires
+@app.route('/admin/players/monsters/add', methods=['POST'])
+def bulk_add_monsters():
+    """
+    Réservé aux services internes (header X-Admin-Key), utilisé par SummonAPI pour finaliser les invocations.
+    Corps NDJSON, une ligne par invocation : username, monster_ids. Chaque ajout est un `$addToSet $each`
+    conditionné à la capacité du joueur ; rejouer une ligne déjà appliquée est sans effet.
+    Retourne un statut par ligne : "ok", "full" (capacité dépassée) ou "missing" (joueur introuvable).
+    """
+    if request.headers.get('X-Admin-Key') != ADMIN_API_KEY:
+        return jsonify({"error": "Accès non autorisé."}), 403
+
+    try:
+        entries = parse_ndjson(request.get_data(as_text=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    for line_number, entry in enumerate(entries, start=1):
+        if not entry.get("username") or not isinstance(entry.get("monster_ids"), list):
+            return jsonify({"error": f"Entrée {line_number} invalide."}), 400
+
+    # Les lignes sont appliquées dans l'ordre : la capacité de chacune tient compte des précédentes
+    results = []
+    for entry in entries:
+        username, monster_ids = entry["username"], entry["monster_ids"]
+        result = players_collection.update_one(
+            {
+                "username": username,
+                "$expr": {"$lte": [{"$size": {"$setUnion": ["$monsters", monster_ids]}}, "$max_monsters"]},
+            },
+            {"$addToSet": {"monsters": {"$each": monster_ids}}},
+        )
+        if result.matched_count:
+            results.append({"username": username, "status": "ok"})
+        elif players_collection.find_one({"username": username}, {"_id": 1}):
+            results.append({"username": username, "status": "full"})
+        else:
+            results.append({"username": username, "status": "missing"})
+
+    print(f"Ajout en masse : {sum(result['status'] == 'ok' for result in results)} ligne(s) appliquée(s) sur {len(results)}.")
+    return jsonify({"results": results}), 200
+
 # Endpoint pour récupérer les informations complètes du joueur
 @app.route('/player', methods=['GET'])
 def get_player():
     """
-    Récupère les informations complètes du joueur connecté.
+    Récupère les informations du joueur connecté (ou seulement les champs de ?fields=).
     """
     username = request.username
     print(f"Requête reçue pour récupérer les informations du joueur {username}.")
-    player = players_collection.find_one({"username": username})
+    try:
+        projection = parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    player = players_collection.find_one({"username": username}, projection)
     if not player:
         print(f"Erreur : Joueur {username} introuvable.")
         return jsonify({"error": "Joueur introuvable."}), 404
@@ -132,30 +267,34 @@ def add_experience():
     data = request.json
     experience_gain = data.get('experience')
 
-    if not experience_gain or experience_gain < 0:
+    if not isinstance(experience_gain, (int, float)) or experience_gain <= 0:
         print("Erreur : Gain d'expérience invalide.")
         return jsonify({"error": "Un gain d'expérience positif est requis."}), 400
 
-    player = players_collection.find_one({"username": username})
+    # Mise à jour atomique côté serveur : ajout de l'expérience et passages de niveau
+    # (table de progression partagée, l'XP excédentaire est conservée), sans fenêtre entre lecture et écriture
+    player = players_collection.find_one_and_update(
+        {"username": username},
+        experience_update_pipeline(
+            experience_gain,
+            # Mise à jour de la limite des monstres (10 + niveau)
+            extra_fields={"max_monsters": {"$add": [10, "$_new_level"]}},
+        ),
+        return_document=ReturnDocument.BEFORE,
+    )
     if not player:
         print(f"Erreur : Joueur {username} introuvable.")
         return jsonify({"error": "Joueur introuvable."}), 404
 
-    player["experience"] += experience_gain
-
-    # Vérifier si le joueur peut monter de niveau
-    level_up_threshold = 50 * math.pow(1.1, player["level"])
-    if player["experience"] >= level_up_threshold:
-        player["level"] += 1
-        player["experience"] = 0  # Réinitialiser l'expérience
-        player["max_monsters"] = 10 + player["level"]  # Mise à jour de la limite des monstres
-
-    players_collection.update_one({"username": username}, {"$set": player})
+    # Même calcul que le pipeline, à partir de l'état précédent renvoyé par Mongo
+    progress = resolve(player["level"], player["experience"], experience_gain)
+    player["level"], player["experience"] = progress.level, progress.experience
+    player["max_monsters"] = 10 + progress.level
 
     # Convertir l'ObjectId en string pour éviter l'erreur de sérialisation
     player["_id"] = str(player["_id"])
     print(f"Expérience mise à jour pour le joueur {username}. Nouvelle expérience : {player['experience']}. Niveau : {player['level']}")
-    return jsonify({"message": "Expérience mise à jour.", "player": player}), 200
+    return jsonify({"message": "Expérience mise à jour.", "player": player, "levels_gained": progress.levels_gained}), 200
 
 # Endpoint pour gérer l'acquisition d'un monstre
 @app.route('/player/monsters', methods=['POST'])
@@ -190,23 +329,29 @@ def add_monster():
         print(f"Erreur de communication avec MonstersAPI : {e}")
         return jsonify({"error": "Erreur de communication avec MonstersAPI."}), 500
 
-    # Récupération du joueur
-    player = players_collection.find_one({"username": username})
+    # Ajout atomique : le filtre vérifie la capacité et l'absence de doublon au moment de l'écriture
+    player = players_collection.find_one_and_update(
+        {
+            "username": username,
+            "monsters": {"$ne": monster_id},
+            "$expr": {"$lt": [{"$size": "$monsters"}, "$max_monsters"]},
+        },
+        {"$push": {"monsters": monster_id}},
+        projection={"monsters": 1},
+        return_document=ReturnDocument.AFTER,
+    )
     if not player:
-        print(f"Erreur : Joueur {username} introuvable.")
-        return jsonify({"error": "Joueur introuvable."}), 404
-
-    if len(player["monsters"]) >= player["max_monsters"]:
+        # Aucune écriture : relecture uniquement pour expliquer le refus
+        player = players_collection.find_one({"username": username}, {"monsters": 1})
+        if not player:
+            print(f"Erreur : Joueur {username} introuvable.")
+            return jsonify({"error": "Joueur introuvable."}), 404
+        if monster_id in player["monsters"]:
+            print(f"Erreur : Monstre {monster_id} déjà présent dans la liste du joueur.")
+            return jsonify({"error": "Monstre déjà présent dans la liste."}), 400
         print("Erreur : Capacité maximale de monstres atteinte.")
         return jsonify({"error": "Capacité maximale de monstres atteinte."}), 400
 
-    if monster_id in player["monsters"]:
-        print(f"Erreur : Monstre {monster_id} déjà présent dans la liste du joueur.")
-        return jsonify({"error": "Monstre déjà présent dans la liste."}), 400
-
-    # Ajout du monstre à l'inventaire
-    player["monsters"].append(monster_id)
-    players_collection.update_one({"username": username}, {"$set": player})
     print(f"Monstre {monster_id} ajouté pour le joueur {username}.")
     return jsonify({"message": "Monstre ajouté avec succès.", "monsters": player["monsters"]}), 201
 
@@ -219,17 +364,19 @@ def remove_monster(monster_id):
     username = request.username
     print(f"Requête reçue pour supprimer le monstre {monster_id} du joueur {username}.")
 
-    player = players_collection.find_one({"username": username})
+    player = players_collection.find_one_and_update(
+        {"username": username, "monsters": monster_id},
+        {"$pull": {"monsters": monster_id}},
+        projection={"monsters": 1},
+        return_document=ReturnDocument.AFTER,
+    )
     if not player:
-        print(f"Erreur : Joueur {username} introuvable.")
-        return jsonify({"error": "Joueur introuvable."}), 404
-
-    if monster_id not in player["monsters"]:
+        if not players_collection.find_one({"username": username}, {"_id": 1}):
+            print(f"Erreur : Joueur {username} introuvable.")
+            return jsonify({"error": "Joueur introuvable."}), 404
         print(f"Erreur : Monstre {monster_id} introuvable dans la liste du joueur.")
         return jsonify({"error": "Monstre introuvable dans la liste du joueur."}), 404
 
-    player["monsters"].remove(monster_id)
-    players_collection.update_one({"username": username}, {"$set": player})
     print(f"Monstre {monster_id} supprimé pour le joueur {username}.")
     return jsonify({"message": "Monstre supprimé avec succès.", "monsters": player["monsters"]}), 200
 
@@ -0,0 +1,34 @@
+import json
+import os
+
+from common.sampler import AliasTable
+
+# Bannière utilisée quand la requête n'en précise pas
+DEFAULT_BANNER = "standard"
+
+
+def load_json(path, default):
+    if not os.path.exists(path):
+        print(f"Erreur : Fichier {os.path.basename(path)} introuvable.")
+        return default
+    with open(path, "r") as file:
+        try:
+            return json.load(file)
+        except json.JSONDecodeError as e:
+            print(f"Erreur lors du chargement de {os.path.basename(path)} : {e}")
+            return default
+
+
+def build_drop_tables(monsters, banners):
+    """
+    Compile une table d'alias par bannière. Une bannière multiplie le lootRate de certains monstres
+    (`rate_up` : {identifiant du monstre: multiplicateur}) ; la bannière standard utilise les taux du catalogue.
+    """
+    banners = dict(banners)
+    banners.setdefault(DEFAULT_BANNER, {})
+    tables = {}
+    for name, banner in banners.items():
+        rate_up = {str(monster_id): multiplier for monster_id, multiplier in banner.get("rate_up", {}).items()}
+        weights = [monster["lootRate"] * rate_up.get(str(monster["_id"]), 1) for monster in monsters]
+        tables[name] = AliasTable(monsters, weights)
+    return tables
@@ -8,12 +8,19 @@
 #  \______/  \______/ \__| \__| \__|\__| \__| \__| \______/ \__|  \__|
 
 import os
-import requests
+import sys
 from flask import Flask, request, jsonify
-from pymongo import MongoClient
-from bson import ObjectId
-import random
-import json
+from pymongo import ASCENDING, MongoClient
+
+# Modules partagés (à la racine du dépôt en local, copiés dans /app/common dans l'image Docker)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.auth_client import AuthClient
+from common.catalog import DEFAULT_CATALOG_PATH, Catalog, CatalogPeer, catalog_response
+from common.idempotency import IdempotencyStore
+from common.indexes import ensure_indexes
+from common.rng import RngStreams
+from drop_tables import DEFAULT_BANNER, build_drop_tables, load_json
+from outbox import SummonOutbox
 
 # Initialisation de Flask
 app = Flask(__name__)
@@ -26,44 +33,87 @@ MONSTERS_API_URL = os.getenv('MONSTERS_API_URL', 'http://localhost:5002')
 AUTH_API_URL = os.getenv('AUTH_API_URL', 'http://localhost:5000')
 PLAYER_API_URL = os.getenv('PLAYER_API_URL', 'http://localhost:5001')  # URL de l'API Player
 API_KEY = os.getenv('API_KEY', 'CLE_API_TRES_SAFE')
+MAX_MULTI_SUMMON = int(os.getenv('MAX_MULTI_SUMMON', 10))  # Nombre maximal d'invocations par /summon/multi
+ADMIN_API_KEY = os.getenv('ADMIN_API_KEY', 'CLE_ADMIN_TRES_SAFE')  # Clé des endpoints d'administration
+RNG_MASTER_SEED = os.getenv('RNG_MASTER_SEED') or None  # Graine maître : tirages reproductibles si définie
 
 # Connexion à MongoDB
 print(f"Connexion à MongoDB sur {DB_HOST}:{DB_PORT}...")
 client = MongoClient(f'mongodb://{DB_HOST}:{DB_PORT}/')
 db = client['summon_db']
-failed_invocations = db['failed_invocations']  # Base tampon pour les invocations échouées
-
-# Chargement des monstres de base depuis un fichier JSON
-monsters_data = []
-data_file_path = os.path.join(os.path.dirname(__file__), "data.json")
-if os.path.exists(data_file_path):
-    with open(data_file_path, "r") as file:
-        try:
-            monsters_data = json.load(file)
-        except json.JSONDecodeError as e:
-            print(f"Erreur lors du chargement de data.json : {e}")
-else:
-    print("Erreur : Fichier data.json introuvable.")
-
-# Fonction pour valider un token via AuthAPI
-def validate_token(token):
+summon_outbox_collection = db['summon_outbox']  # Invocations enregistrées avant tout effet de bord
+
+INDEXES = [
+    (summon_outbox_collection, [("status", ASCENDING), ("next_attempt_at", ASCENDING)], {}),
+    (summon_outbox_collection, [("status", ASCENDING), ("lease_expires_at", ASCENDING)], {}),
+    (summon_outbox_collection, [("completed_at", ASCENDING)], {"expireAfterSeconds": 7 * 86400}),
+]
+
+ensure_indexes(INDEXES)
+
+# Réponses des invocations portant un header Idempotency-Key (rejouées en cas de doublon)
+idempotency = IdempotencyStore(db['idempotency_keys'], ttl=int(os.getenv('IDEMPOTENCY_TTL', 86400)))
+idempotency.ensure_indexes()
+
+CATALOG_PATH = os.getenv('CATALOG_PATH', DEFAULT_CATALOG_PATH)  # Catalogue partagé avec MonstersAPI
+CATALOG_POLL_INTERVAL = float(os.getenv('CATALOG_POLL_INTERVAL', 5))
+CATALOG_PEER_CHECK = os.getenv('CATALOG_PEER_CHECK', 'true').lower() == 'true'  # Comparaison avec le catalogue de MonstersAPI
+BANNERS_FILE_PATH = os.getenv('BANNERS_PATH', os.path.join(os.path.dirname(__file__), "banners.json"))
+
+def rebuild_drop_tables(version):
+    """
+    Compile les tables de tirage d'une version du catalogue (et des bannières) puis les remplace en une
+    seule affectation : les invocations en cours utilisent l'ancienne table ou la nouvelle, jamais un
+    état intermédiaire. Appelée à chaque nouvelle version du catalogue.
+    """
+    global drop_tables
+    banners = load_json(BANNERS_FILE_PATH, {})
     try:
-        response = requests.post(f"{AUTH_API_URL}/validate", json={"token": token})
-        if response.status_code == 200:
-            return response.json().get("username")
-        return None
-    except requests.exceptions.RequestException as e:
-        print(f"Erreur lors de la validation du token : {e}")
-        return None
+        tables = build_drop_tables(version.monsters, banners)
+    except (KeyError, TypeError, ValueError) as e:
+        print(f"Erreur lors de la construction des tables d'invocation : {e}")
+        return
+    drop_tables = (version.version, tables)
+    print(f"Tables d'invocation prêtes (catalogue {version.version[:12]}) : bannières {', '.join(sorted(tables))}.")
+
+# Version du catalogue et tables de tirage construites à partir d'elle
+drop_tables = (None, {})
+catalog = Catalog(CATALOG_PATH, poll_interval=CATALOG_POLL_INTERVAL)
+catalog.subscribe(rebuild_drop_tables)
+catalog.reload()
+catalog.start()
+
+# Version du catalogue chargée par MonstersAPI, revérifiée dès que le catalogue local change : tant que les deux
+# versions diffèrent, les invocations sont refusées
+catalog_peer = CatalogPeer(f"{MONSTERS_API_URL}/catalog", poll_interval=CATALOG_POLL_INTERVAL if CATALOG_PEER_CHECK else 0)
+catalog.subscribe(lambda version: catalog_peer.wake())
+catalog_peer.start()
+
+# Un générateur aléatoire par requête (déterministe si RNG_MASTER_SEED est définie)
+rng_streams = RngStreams(RNG_MASTER_SEED)
+if rng_streams.deterministic:
+    print("Mode déterministe : les tirages d'invocation sont reproductibles.")
+
+# Client partagé de validation des tokens (avec cache)
+auth_client = AuthClient(AUTH_API_URL)
+
+# Worker de finalisation des invocations en attente
+outbox = SummonOutbox(
+    summon_outbox_collection, MONSTERS_API_URL, PLAYER_API_URL, API_KEY, ADMIN_API_KEY,
+    batch_size=int(os.getenv('SUMMON_OUTBOX_BATCH_SIZE', 100)),
+    max_attempts=int(os.getenv('SUMMON_OUTBOX_MAX_ATTEMPTS', 10)),
+    claim_timeout=float(os.getenv('SUMMON_OUTBOX_CLAIM_TIMEOUT', 120)),
+)
+outbox.start()
 
 # Middleware pour valider le token
 @app.before_request
 def verify_token():
-    if request.endpoint not in ['health_check']:
+    if request.endpoint not in ['health_check', 'metrics', 'get_catalog', 'reload_catalog', 'replay_invocations']:
         token = request.headers.get('Authorization')
         if not token:
             return jsonify({"error": "Token manquant."}), 401
-        username = validate_token(token)
+        username = auth_client.validate(token)
         if not username:
             return jsonify({"error": "Token invalide ou expiré."}), 401
         request.username = username
@@ -73,100 +123,209 @@ def verify_token():
 def health_check():
     return jsonify({"message": "L'API fonctionne correctement !"}), 200
 
+# Endpoint pour exposer les métriques internes du service (public)
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Retourne les compteurs du cache de validation des tokens, l'état de l'outbox des invocations
+    et la version du catalogue, comparée à celle de MonstersAPI (`in_sync` vaut None tant qu'elle est inconnue).
+    """
+    catalog_version = drop_tables[0]
+    return jsonify({
+        "auth_cache": auth_client.stats(),
+        "summon_outbox": outbox.stats(),
+        "idempotency": idempotency.stats(),
+        "catalog": dict(
+            catalog.stats(),
+            monsters_api=catalog_peer.stats(),
+            in_sync=None if catalog_peer.version is None else catalog_peer.version == catalog_version,
+        ),
+        "rng": rng_streams.stats(),
+    }), 200
+
+# Endpoint public pour récupérer le catalogue des monstres de base
+@app.route('/catalog', methods=['GET'])
+def get_catalog():
+    """
+    Retourne la version courante du catalogue avec son ETag ; 304 si le client l'a déjà (If-None-Match).
+    """
+    version = catalog.current
+    if version is None:
+        return jsonify({"error": "Catalogue indisponible."}), 503
+    return catalog_response(version)
+
+# Endpoint d'administration pour recharger le catalogue et les bannières sans redémarrer le service
+@app.route('/catalog/reload', methods=['POST'])
+def reload_catalog():
+    """
+    Réservé à l'administration (header X-Admin-Key) : relit le catalogue et les bannières,
+    puis reconstruit les tables de tirage.
+    """
+    if request.headers.get('X-Admin-Key') != ADMIN_API_KEY:
+        return jsonify({"error": "Accès non autorisé."}), 403
+
+    version, changed = catalog.reload(force=True)
+    if version is None:
+        return jsonify({"error": "Catalogue indisponible."}), 503
+    if not changed:
+        # Catalogue inchangé : les bannières ont pu changer
+        rebuild_drop_tables(version)
+    return jsonify({"version": version.version, "changed": changed, "monsters": len(version)}), 200
+
+# Endpoint pour lister les bannières et leurs taux
+@app.route('/banners', methods=['GET'])
+def list_banners():
+    """
+    Retourne, pour chaque bannière, la probabilité d'obtenir chaque monstre du catalogue.
+    """
+    return jsonify({
+        name: [
+            {"id": monster["_id"], "element": monster["element"], "probability": probability}
+            for monster, probability in zip(table.items, table.probabilities)
+        ]
+        for name, table in drop_tables[1].items()
+    }), 200
+
+def monster_payload(template, rng):
+    """
+    Données d'invocation envoyées à MonstersAPI pour un monstre du catalogue. `name_seed`, tiré dans
+    le flux de la requête, sert de clé au flux du nom : en mode déterministe, une même séquence
+    d'invocations donne les mêmes noms.
+    """
+    return {
+        "name_seed": format(rng.getrandbits(64), "016x"),
+        "monster_type": template["element"],
+        "element": template["element"],
+        "hp": template["hp"],
+        "atk": template["atk"],
+        "def": template["def"],
+        "vit": template["vit"],
+        "skills": template["skills"],
+    }
+
+def catalog_drift_response(catalog_version):
+    """
+    Réponse 503 si MonstersAPI a chargé une autre version du catalogue que les tables de tirage,
+    None sinon (versions identiques ou version de MonstersAPI encore inconnue).
+    """
+    if not catalog_peer.diverges(catalog_version):
+        return None
+    print(f"Invocation refusée : catalogue {str(catalog_version)[:12]} différent de celui de MonstersAPI ({catalog_peer.version[:12]}).")
+    return jsonify({"error": "Catalogue en cours de synchronisation entre les services. Réessayez plus tard."}), 503
+
+def summon_response(job, status, reason):
+    """
+    Réponse d'une invocation selon l'état de son enregistrement dans l'outbox.
+    """
+    if status == "done":
+        return None
+    if status == "rejected":
+        if reason == "full":
+            return jsonify({"error": "Capacité maximale de monstres atteinte."}), 400
+        return jsonify({"error": "Joueur introuvable."}), 404
+    # Finalisation différée : le worker termine l'invocation, les identifiants sont déjà attribués
+    print(f"Invocation {job['_id']} enregistrée, finalisation différée.")
+    return jsonify({
+        "message": "Invocation enregistrée, finalisation en cours.",
+        "summon_id": job["_id"],
+        "monster_ids": [monster["_id"] for monster in job["monsters"]],
+    }), 202
+
 # Endpoint pour invoquer un monstre
 @app.route('/summon', methods=['POST'])
+@idempotency.idempotent
 def summon_monster():
     username = request.username
-    print(f"{username} tente d'invoquer un monstre...")
+    banner = request.args.get('banner', DEFAULT_BANNER)
+    print(f"{username} tente d'invoquer un monstre (bannière {banner})...")
 
-    if not monsters_data:
+    catalog_version, tables = drop_tables
+    if not tables:
         return jsonify({"error": "Aucun monstre disponible pour l'invocation."}), 500
+    if banner not in tables:
+        return jsonify({"error": f"Bannière inconnue : {banner}."}), 400
+    drift = catalog_drift_response(catalog_version)
+    if drift:
+        return drift
 
-    # Algorithme d'invocation basé sur lootRate
-    total_loot_rate = sum(monster["lootRate"] for monster in monsters_data)
-    random_pick = random.uniform(0, total_loot_rate)
-    cumulative_rate = 0
+    # Tirage en O(1) dans la table d'alias précalculée (probabilités proportionnelles à lootRate)
+    rng = rng_streams.for_request(username, request.path)
+    selected_monster = tables[banner].sample(rng)
 
-    selected_monster = None
-    for monster in monsters_data:
-        cumulative_rate += monster["lootRate"]
-        if random_pick <= cumulative_rate:
-            selected_monster = monster
-            break
+    # Enregistrement durable avant tout effet de bord, puis finalisation immédiate si possible
+    try:
+        job = outbox.record(username, [monster_payload(selected_monster, rng)], banner, catalog_version)
+    except Exception as e:
+        print(f"Invocation échouée : {e}")
+        return jsonify({"error": "Erreur lors de l'invocation. Réessayez plus tard."}), 500
+    monsters, status, reason = outbox.process(job)
+    response = summon_response(job, status, reason)
+    if response:
+        return response
 
-    if not selected_monster:
-        return jsonify({"error": "Erreur lors de la sélection du monstre."}), 500
+    monster_id = monsters[0]["_id"]
+    print(f"Monstre invoqué avec succès : {monster_id}")
+    return jsonify({"message": "Invocation réussie.", "monster_id": monster_id, "monster": monsters[0]}), 201
 
-    # Création du monstre dans MonstersAPI
+# Endpoint pour invoquer plusieurs monstres en une fois
+@app.route('/summon/multi', methods=['POST'])
+@idempotency.idempotent
+def summon_multi():
+    """
+    Invoque `count` monstres (paramètre de requête, MAX_MULTI_SUMMON au plus) : une seule réservation
+    d'inventaire (qui vérifie la capacité pour tout le lot) et une création groupée dans MonstersAPI.
+    Retourne les monstres créés.
+    """
+    username = request.username
+    banner = request.args.get('banner', DEFAULT_BANNER)
+    try:
+        count = int(request.args.get('count', MAX_MULTI_SUMMON))
+    except ValueError:
+        return jsonify({"error": "Le paramètre count doit être un entier."}), 400
+    if count < 1 or count > MAX_MULTI_SUMMON:
+        return jsonify({"error": f"Entre 1 et {MAX_MULTI_SUMMON} invocations par requête."}), 400
+    print(f"{username} tente d'invoquer {count} monstres (bannière {banner})...")
+
+    catalog_version, tables = drop_tables
+    if not tables:
+        return jsonify({"error": "Aucun monstre disponible pour l'invocation."}), 500
+    if banner not in tables:
+        return jsonify({"error": f"Bannière inconnue : {banner}."}), 400
+    drift = catalog_drift_response(catalog_version)
+    if drift:
+        return drift
+
+    table = tables[banner]
+    rng = rng_streams.for_request(username, request.path)
     try:
-        response = requests.post(
-            f"{MONSTERS_API_URL}/monsters",
-            headers={"X-API-Key": API_KEY},
-            json={
-                "monster_type": selected_monster["element"],
-                "element": selected_monster["element"],
-                "hp": selected_monster["hp"],
-                "atk": selected_monster["atk"],
-                "def": selected_monster["def"],
-                "vit": selected_monster["vit"],
-                "skills": selected_monster["skills"],
-                "owner": username,
-            },
-        )
-        if response.status_code == 201:
-            monster_id = response.json()["id"]
-            print(f"Monstre invoqué avec succès : {monster_id}")
-            
-            # Ajout du monstre à PlayerAPI
-            try:
-                player_response = requests.post(
-                    f"{PLAYER_API_URL}/player/monsters",
-                    headers={"Authorization": request.headers.get("Authorization")},
-                    json={"monster_id": monster_id},
-                )
-                if player_response.status_code != 201:
-                    raise Exception(f"Erreur PlayerAPI : {player_response.text}")
-            except Exception as e:
-                print(f"Erreur lors de l'ajout du monstre dans PlayerAPI : {e}")
-                return jsonify({"error": "Erreur lors de l'ajout dans l'inventaire."}), 500
-
-            return jsonify({"message": "Invocation réussie.", "monster_id": monster_id}), 201
-        else:
-            raise Exception(f"Erreur MonstersAPI : {response.text}")
+        job = outbox.record(username, [monster_payload(table.sample(rng), rng) for _ in range(count)], banner, catalog_version)
     except Exception as e:
-        print(f"Invocation échouée : {e}")
+        print(f"Invocation multiple échouée : {e}")
         return jsonify({"error": "Erreur lors de l'invocation. Réessayez plus tard."}), 500
+    monsters, status, reason = outbox.process(job)
+    response = summon_response(job, status, reason)
+    if response:
+        return response
 
-# Endpoint pour rejouer les invocations échouées
+    print(f"{count} monstre(s) invoqué(s) avec succès pour {username}.")
+    return jsonify({"message": "Invocation réussie.", "monsters": monsters}), 201
+
+# Endpoint d'administration pour rejouer les invocations en lettre morte
 @app.route('/replay', methods=['POST'])
 def replay_invocations():
-    invocations = list(failed_invocations.find())
-    for invocation in invocations:
-        username = invocation["username"]
-        monster = invocation["monster"]
-        print(f"Rejeu pour {username} : {monster}")
-
-        try:
-            response = requests.post(
-                f"{MONSTERS_API_URL}/monsters",
-                headers={"X-API-Key": API_KEY},
-                json={
-                    "monster_type": monster["element"],  # Utiliser "element" comme "monster_type"
-                    "element": monster["element"],
-                    "hp": monster["hp"],
-                    "atk": monster["atk"],
-                    "def": monster["def"],
-                    "vit": monster["vit"],
-                    "skills": monster["skills"],
-                },
-            )
-            if response.status_code == 201:
-                failed_invocations.delete_one({"_id": invocation["_id"]})
-        except Exception as e:
-            print(f"Erreur lors du rejeu : {e}")
-
-    return jsonify({"message": "Rejeu terminé."}), 200
+    """
+    Réservé à l'administration (header X-Admin-Key) : remet en attente les invocations abandonnées
+    après trop d'échecs ; le worker les finalise ensuite.
+    """
+    if request.headers.get('X-Admin-Key') != ADMIN_API_KEY:
+        return jsonify({"error": "Accès non autorisé."}), 403
+
+    replayed = outbox.replay()
+    print(f"{replayed} invocation(s) remise(s) en attente.")
+    return jsonify({"message": "Rejeu lancé.", "replayed": replayed}), 200
 
 # Point d'entrée
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=API_PORT, debug=True)
+    # Sans rechargeur : le processus parent de Werkzeug importerait aussi le module et lancerait
+    # une seconde fois les workers en arrière-plan sur les mêmes collections
+    app.run(host='0.0.0.0', port=API_PORT, debug=True, use_reloader=False)
@@ -0,0 +1,307 @@
+import datetime
+
+import requests
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+
+from common.ndjson import chunked
+from common.outbox import OutboxWorker, post_ndjson
+
+
+class SummonOutbox(OutboxWorker):
+    """
+    Outbox durable des invocations.
+
+    Chaque invocation est enregistrée dans `collection` avant tout effet de bord, avec les
+    identifiants des monstres générés à l'avance. Elle est ensuite finalisée en deux étapes
+    idempotentes : "inventory" (réservation des places dans l'inventaire PlayerAPI, `$addToSet`
+    conditionné à la capacité) puis "create" (création des monstres dans MonstersAPI, rejouable
+    grâce aux identifiants fixés). Un inventaire plein est ainsi détecté avant toute création.
+
+    `process` tente de finaliser immédiatement une invocation depuis la requête ; en cas d'échec,
+    le thread reprend les invocations en attente par lots (un appel par service et par lot),
+    avec un délai qui double à chaque tentative. Après `max_attempts` échecs, l'invocation est
+    annulée (étape "compensate", rejouable et réessayée jusqu'au succès) : les monstres déjà créés
+    par une tranche réussie sont supprimés de MonstersAPI, puis les places réservées sont libérées
+    (`$pullAll`). L'invocation passe ensuite en "dead" (lettre morte) et peut être remise en attente
+    via `replay`. Une invocation refusée (inventaire plein, joueur inconnu) passe en "rejected".
+
+    Une invocation en cours de traitement est réservée ("processing") par un bail de `claim_timeout`
+    secondes, pris atomiquement (`find_one_and_update`) : plusieurs workers ou processus ne traitent
+    jamais la même invocation en même temps, et une invocation dont le bail expire (processus arrêté
+    en cours de route) est reprise. Les écritures de fin de traitement ne s'appliquent que si le bail
+    (`lease`) est toujours celui du détenteur.
+    """
+
+    name = "summon-outbox"
+
+    def __init__(self, collection, monsters_api_url, player_api_url, api_key, admin_api_key,
+                 interval=2.0, batch_size=100, max_backoff=300, max_attempts=10, claim_timeout=120, create_chunk_size=200):
+        super().__init__(interval, batch_size, max_backoff)
+        self.collection = collection
+        self.monsters_api_url = monsters_api_url
+        self.player_api_url = player_api_url
+        self.api_key = api_key
+        self.admin_api_key = admin_api_key
+        self.max_attempts = max_attempts
+        self.claim_timeout = claim_timeout
+        self.create_chunk_size = create_chunk_size
+
+    def record(self, username, payloads, banner, catalog_version=None):
+        """
+        Enregistre une invocation de `payloads` (données d'invocation) pour `username`,
+        tirée dans `banner` avec la version `catalog_version` du catalogue.
+        Retourne le document de l'outbox, dont les monstres portent déjà leur identifiant.
+        """
+        now = datetime.datetime.utcnow()
+        # La requête finalise elle-même l'invocation : elle est enregistrée avec son bail,
+        # le worker ne la reprend qu'à son expiration
+        job = {
+            "_id": str(ObjectId()),
+            "username": username,
+            "banner": banner,
+            "catalog_version": catalog_version,
+            "monsters": [dict(payload, _id=str(ObjectId())) for payload in payloads],
+            "step": "inventory",
+            "status": "processing",
+            "lease": str(ObjectId()),
+            "lease_expires_at": now + datetime.timedelta(seconds=self.claim_timeout),
+            "attempts": 0,
+            "created_at": now,
+            "next_attempt_at": now,
+        }
+        self.collection.insert_one(job)
+        return job
+
+    def process(self, job):
+        """
+        Finalise tout de suite une invocation dont le bail est détenu (retournée par `record`).
+        Retourne (monstres créés ou None, statut de l'invocation, motif de refus ou None).
+        """
+        return self._process_batch([job]).get(job["_id"], (None, "pending", None))
+
+    def replay(self):
+        """
+        Remet en attente les invocations en lettre morte. Retourne leur nombre.
+        """
+        now = datetime.datetime.utcnow()
+        result = self.collection.update_many(
+            {"status": "dead"},
+            {"$set": {"step": "inventory", "status": "pending", "attempts": 0, "next_attempt_at": now}},
+        )
+        self.wake()
+        return result.modified_count
+
+    def claim(self):
+        """
+        Réserve atomiquement une invocation arrivée à échéance (ou dont le bail a expiré).
+        Retourne le document réservé, ou None s'il n'y en a pas.
+        """
+        now = datetime.datetime.utcnow()
+        return self.collection.find_one_and_update(
+            {"$or": [
+                {"status": "pending", "next_attempt_at": {"$lte": now}},
+                {"status": "processing", "lease_expires_at": {"$lte": now}},
+            ]},
+            {"$set": {
+                "status": "processing",
+                "lease": str(ObjectId()),
+                "lease_expires_at": now + datetime.timedelta(seconds=self.claim_timeout),
+            }},
+            sort=[("next_attempt_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def drain(self):
+        """
+        Réserve puis traite un lot d'invocations. Retourne le nombre d'invocations traitées.
+        """
+        jobs = []
+        while len(jobs) < self.batch_size:
+            job = self.claim()
+            if job is None:
+                break
+            jobs.append(job)
+        if jobs:
+            self._process_batch(jobs)
+        return len(jobs)
+
+    def stats(self):
+        unfinished = {"status": {"$in": ["pending", "processing"]}}
+        oldest = self.collection.find_one(unfinished, {"created_at": 1}, sort=[("created_at", 1)])
+        age = (datetime.datetime.utcnow() - oldest["created_at"]).total_seconds() if oldest else 0.0
+        return {
+            "pending": self.collection.count_documents({"status": "pending"}),
+            "processing": self.collection.count_documents({"status": "processing"}),
+            "compensating": self.collection.count_documents(dict(unfinished, step="compensate")),
+            "dead": self.collection.count_documents({"status": "dead"}),
+            "oldest_pending_seconds": round(age, 1),
+        }
+
+    def _process_batch(self, jobs):
+        """
+        Fait avancer chaque invocation du lot d'autant d'étapes que possible.
+        Retourne {id de l'invocation: (monstres créés ou None, statut, motif de refus ou None)}.
+        """
+        now = datetime.datetime.utcnow()
+        outcome = {}
+        failures = {}
+        operations = []
+
+        # Invocations abandonnées : suppression des monstres déjà créés puis libération des places
+        # réservées, avant le passage en lettre morte
+        to_compensate = [job for job in jobs if job["step"] == "compensate"]
+        if to_compensate:
+            error = self._delete_monsters([
+                {"_id": monster["_id"], "owner": job["username"]} for job in to_compensate for monster in job["monsters"]
+            ])
+            if error is None:
+                error = self._remove_from_inventories(to_compensate)
+            for job in to_compensate:
+                attempts = job.get("attempts", 0) + 1
+                if error is None:
+                    outcome[job["_id"]] = (None, "dead", None)
+                    operations.append(UpdateOne(self._leased(job), {"$set": {
+                        "step": "inventory", "status": "dead", "attempts": attempts, "compensated_at": now,
+                    }}))
+                else:
+                    outcome[job["_id"]] = (None, "pending", None)
+                    operations.append(UpdateOne(self._leased(job), {"$set": {
+                        "status": "pending",
+                        "attempts": attempts,
+                        "last_error": error,
+                        "next_attempt_at": self.retry_at(now, attempts),
+                    }}))
+            if error is not None:
+                print(f"Échec de l'annulation de {len(to_compensate)} invocation(s) abandonnée(s) : {error}")
+
+        # Étape 1 : réservation des places dans les inventaires, en un seul appel pour tout le lot
+        to_reserve = [job for job in jobs if job["step"] == "inventory"]
+        if to_reserve:
+            statuses, error = self._add_to_inventories(to_reserve)
+            for job in to_reserve:
+                if error is not None:
+                    failures[job["_id"]] = error
+                elif statuses[job["_id"]] == "ok":
+                    job["step"] = "create"
+                else:
+                    # Inventaire plein ou joueur inconnu : aucun effet de bord, une nouvelle tentative ne changerait rien
+                    outcome[job["_id"]] = (None, "rejected", statuses[job["_id"]])
+                    operations.append(UpdateOne(self._leased(job), {
+                        "$set": {"status": "rejected", "reason": statuses[job["_id"]], "completed_at": now},
+                        "$inc": {"attempts": 1},
+                    }))
+
+        # Étape 2 : création des monstres, en un appel groupé pour tout le lot
+        to_create = [job for job in jobs if job["step"] == "create"]
+        if to_create:
+            monsters, error = self._create_monsters([
+                dict(monster, owner=job["username"]) for job in to_create for monster in job["monsters"]
+            ])
+            for job in to_create:
+                if error is not None:
+                    failures[job["_id"]] = error
+                    continue
+                created = {monster["_id"]: monster for monster in monsters}
+                outcome[job["_id"]] = ([created[monster["_id"]] for monster in job["monsters"]], "done", None)
+                operations.append(UpdateOne(self._leased(job), {
+                    "$set": {"step": "create", "status": "done", "completed_at": now},
+                    "$inc": {"attempts": 1},
+                }))
+
+        for job in jobs:
+            if job["_id"] not in failures:
+                continue
+            attempts = job.get("attempts", 0) + 1
+            outcome[job["_id"]] = (None, "pending", None)
+            if attempts >= self.max_attempts:
+                # Abandon : monstres déjà créés et places réservées sont annulés avant la lettre morte
+                step, next_attempt_at = "compensate", now
+            else:
+                step, next_attempt_at = job["step"], self.retry_at(now, attempts)
+            operations.append(UpdateOne(self._leased(job), {"$set": {
+                "step": step,
+                "status": "pending",
+                "attempts": attempts,
+                "last_error": failures[job["_id"]],
+                "next_attempt_at": next_attempt_at,
+            }}))
+
+        if operations:
+            self.collection.bulk_write(operations, ordered=False)
+        if failures:
+            print(f"Échec de la finalisation de {len(failures)} invocation(s), nouvel essai différé : {next(iter(failures.values()))}")
+        return outcome
+
+    def _create_monsters(self, monsters):
+        """
+        Crée les monstres dans MonstersAPI (un appel par tranche de `create_chunk_size`).
+        Retourne (monstres créés, None) ou (None, message d'erreur).
+        """
+        created = []
+        for chunk in chunked(monsters, self.create_chunk_size):
+            try:
+                response = requests.post(
+                    f"{self.monsters_api_url}/monsters/bulk",
+                    headers={"X-API-Key": self.api_key},
+                    json={"monsters": chunk},
+                    timeout=30,
+                )
+            except requests.exceptions.RequestException as e:
+                return None, f"Erreur de communication avec MonstersAPI : {e}"
+            if response.status_code != 201:
+                return None, f"MonstersAPI a répondu {response.status_code} : {response.text}"
+            created.extend(response.json()["monsters"])
+        return created, None
+
+    def _delete_monsters(self, monsters):
+        """
+        Supprime de MonstersAPI les monstres {"_id", "owner"} d'invocations abandonnées (un appel par tranche
+        de `create_chunk_size`, sans effet pour ceux qui n'existent pas). Retourne None en cas de succès,
+        sinon un message d'erreur.
+        """
+        for chunk in chunked(monsters, self.create_chunk_size):
+            try:
+                response = requests.post(
+                    f"{self.monsters_api_url}/monsters/bulk/delete",
+                    headers={"X-API-Key": self.api_key},
+                    json={"monsters": chunk},
+                    timeout=30,
+                )
+            except requests.exceptions.RequestException as e:
+                return f"Erreur de communication avec MonstersAPI : {e}"
+            if response.status_code != 200:
+                return f"MonstersAPI a répondu {response.status_code} : {response.text}"
+        return None
+
+    def _add_to_inventories(self, jobs):
+        """
+        Ajoute les monstres de chaque invocation à l'inventaire de son joueur.
+        Retourne ({id de l'invocation: "ok" | "full" | "missing"}, None) ou (None, message d'erreur).
+        """
+        response, error = post_ndjson(
+            f"{self.player_api_url}/admin/players/monsters/add", self._inventory_items(jobs), self.admin_api_key, "PlayerAPI",
+        )
+        if error is not None:
+            return None, error
+        results = response.json()["results"]
+        return {job["_id"]: result["status"] for job, result in zip(jobs, results)}, None
+
+    def _remove_from_inventories(self, jobs):
+        """
+        Retire des inventaires les monstres réservés par chaque invocation (`$pullAll`, sans effet s'ils sont absents).
+        Retourne None en cas de succès, sinon un message d'erreur.
+        """
+        _, error = post_ndjson(
+            f"{self.player_api_url}/admin/players/monsters/remove", self._inventory_items(jobs), self.admin_api_key, "PlayerAPI",
+        )
+        return error
+
+    @staticmethod
+    def _inventory_items(jobs):
+        return [{"username": job["username"], "monster_ids": [monster["_id"] for monster in job["monsters"]]} for job in jobs]
+
+    @staticmethod
+    def _leased(job):
+        # Filtre des écritures de fin de traitement : sans effet si le bail a été repris entre-temps
+        return {"_id": job["_id"], "lease": job["lease"]}
@@ -0,0 +1,180 @@
+"""
+Simulation hors ligne des taux d'invocation : vérifie que les tables de tirage (catalogue common/data.json
+et bannières de banners.json) donnent bien les taux annoncés, sans passer par /summon.
+
+Le tirage reprend exactement les tables d'alias de SummonAPI (common/sampler.py), vectorisées
+avec NumPy par lots. Pour chaque bannière : taux observés avec intervalle de confiance de Wilson,
+test du khi-deux d'adéquation, et séries sans le monstre le plus rare (utile pour régler une pitié).
+Exemple :
+    python simulate_rates.py --pulls 20000000 --banner water_rate_up --seed 42
+"""
+import argparse
+import math
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from drop_tables import build_drop_tables, load_json
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Quantile de la loi normale pour un intervalle de confiance à 95 %
+Z_95 = 1.959963984540054
+
+
+def wilson_interval(successes, trials, z=Z_95):
+    """
+    Intervalle de confiance de Wilson d'une proportion.
+    """
+    if trials == 0:
+        return 0.0, 1.0
+    p = successes / trials
+    denominator = 1 + z * z / trials
+    center = (p + z * z / (2 * trials)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / trials + z * z / (4 * trials * trials)) / denominator
+    return center - margin, center + margin
+
+
+def chi2_sf(statistic, dof):
+    """
+    Probabilité qu'une loi du khi-deux à `dof` degrés de liberté dépasse `statistic` (p-valeur),
+    via la fonction gamma incomplète régularisée (série ou fraction continue selon la zone).
+    """
+    if statistic <= 0:
+        return 1.0
+    a, x = dof / 2.0, statistic / 2.0
+    log_prefix = a * math.log(x) - x - math.lgamma(a)
+    if x < a + 1:
+        # Série de P(a, x), puis Q = 1 - P
+        term = total = 1.0 / a
+        n = a
+        while abs(term) > abs(total) * 1e-15:
+            n += 1
+            term *= x / n
+            total += term
+        return max(0.0, 1.0 - total * math.exp(log_prefix))
+    # Fraction continue de Q(a, x) (méthode de Lentz)
+    tiny = 1e-300
+    b = x + 1 - a
+    c = 1 / tiny
+    d = 1 / b
+    h = d
+    for i in range(1, 1000):
+        an = -i * (i - a)
+        b += 2
+        d = an * d + b
+        d = tiny if abs(d) < tiny else d
+        c = b + an / c
+        c = tiny if abs(c) < tiny else c
+        d = 1 / d
+        delta = d * c
+        h *= delta
+        if abs(delta - 1) < 1e-15:
+            break
+    return math.exp(log_prefix) * h
+
+
+def simulate(table, pulls, batch_size, rng, target):
+    """
+    Tire `pulls` invocations par lots. Retourne (effectifs par monstre, écarts entre deux obtentions
+    de `target`, plus longue série sans `target`).
+    """
+    thresholds, aliases = (np.asarray(column) for column in table.columns())
+    counts = np.zeros(len(table), dtype=np.int64)
+    gaps = []
+    last_hit = -1  # Position de la dernière obtention de la cible (-1 : avant le premier tirage)
+    longest_drought = 0
+
+    done = 0
+    while done < pulls:
+        size = min(batch_size, pulls - done)
+        columns = rng.integers(0, len(table), size=size)
+        picks = np.where(rng.random(size) < thresholds[columns], columns, aliases[columns])
+        counts += np.bincount(picks, minlength=len(table))
+
+        hits = np.flatnonzero(picks == target) + done
+        if hits.size:
+            batch_gaps = np.diff(hits, prepend=last_hit)
+            gaps.append(batch_gaps)
+            longest_drought = max(longest_drought, int(batch_gaps.max()) - 1)
+            last_hit = int(hits[-1])
+        done += size
+    longest_drought = max(longest_drought, pulls - 1 - last_hit)
+
+    return counts, (np.concatenate(gaps) if gaps else np.zeros(0, dtype=np.int64)), longest_drought
+
+
+def report(name, table, pulls, batch_size, rng):
+    probabilities = np.asarray(table.probabilities)
+    target = int(np.argmin(np.where(probabilities > 0, probabilities, np.inf)))
+
+    start = time.perf_counter()
+    counts, gaps, longest_drought = simulate(table, pulls, batch_size, rng, target)
+    elapsed = time.perf_counter() - start
+
+    print(f"\n=== Bannière {name} : {pulls:,} invocations en {elapsed:.2f}s ({pulls / elapsed / 1e6:.1f} M/s) ===")
+    print(f"{'monstre':>8} {'élément':>8} {'attendu':>9} {'observé':>9} {'IC 95 % (Wilson)':>21} {'écart (σ)':>10}")
+    for i, monster in enumerate(table.items):
+        expected, observed = probabilities[i], counts[i] / pulls
+        low, high = wilson_interval(int(counts[i]), pulls)
+        sigma = math.sqrt(expected * (1 - expected) / pulls) if 0 < expected < 1 else 0.0
+        deviation = (observed - expected) / sigma if sigma else 0.0
+        flag = "" if low <= expected <= high else "  <-- hors intervalle"
+        print(f"{str(monster['_id']):>8} {monster['element']:>8} {expected:>9.5f} {observed:>9.5f} "
+              f"[{low:.5f}, {high:.5f}] {deviation:>+10.2f}{flag}")
+
+    expected_counts = probabilities * pulls
+    mask = expected_counts > 0
+    statistic = float((((counts - expected_counts) ** 2)[mask] / expected_counts[mask]).sum())
+    dof = int(mask.sum()) - 1
+    p_value = chi2_sf(statistic, dof) if dof > 0 else 1.0
+    print(f"Khi-deux : {statistic:.2f} pour {dof} degré(s) de liberté, p-valeur {p_value:.4f}"
+          + ("  <-- écart significatif" if p_value < 0.01 else ""))
+
+    p = probabilities[target]
+    print(f"Monstre le plus rare : {table.items[target]['_id']} (p = {p:.5f}), {len(gaps):,} obtention(s)")
+    if len(gaps):
+        print(f"  invocations entre deux obtentions : moyenne {gaps.mean():.2f} (théorique {1 / p:.2f})")
+        for quantile in (0.5, 0.9, 0.99, 0.999):
+            observed = int(np.quantile(gaps, quantile))
+            # Loi géométrique : plus petit n tel que P(obtenu en n invocations au plus) >= quantile
+            theoretical = math.ceil(math.log(1 - quantile) / math.log(1 - p)) if p < 1 else 1
+            print(f"  {quantile * 100:g} % des obtentions en {observed} invocations ou moins (théorique {theoretical})")
+    print(f"  plus longue série sans l'obtenir : {longest_drought} invocations")
+
+
+def main():
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Simulation Monte-Carlo des taux d'invocation.")
+    parser.add_argument("--pulls", type=int, default=20_000_000, help="Invocations simulées par bannière")
+    parser.add_argument("--batch", type=int, default=5_000_000, help="Tirages par lot NumPy")
+    parser.add_argument("--banner", action="append", help="Bannière(s) à simuler (toutes par défaut)")
+    parser.add_argument("--seed", type=int, default=None, help="Graine du générateur (résultats reproductibles)")
+    parser.add_argument("--data", default=os.getenv('CATALOG_PATH', os.path.join(base_dir, "..", "common", "data.json")),
+                        help="Catalogue des monstres")
+    parser.add_argument("--banners", default=os.getenv('BANNERS_PATH', os.path.join(base_dir, "banners.json")),
+                        help="Définition des bannières (multiplicateurs rate_up)")
+    args = parser.parse_args()
+
+    if np is None:
+        sys.exit("NumPy est requis pour la simulation : pip install -r requirements-dev.txt")
+
+    monsters = load_json(args.data, [])
+    if not monsters:
+        sys.exit("Catalogue vide ou introuvable.")
+    tables = build_drop_tables(monsters, load_json(args.banners, {}))
+    unknown = set(args.banner or []) - set(tables)
+    if unknown:
+        sys.exit(f"Bannière(s) inconnue(s) : {', '.join(sorted(unknown))}")
+
+    rng = np.random.default_rng(args.seed)
+    for name in args.banner or sorted(tables):
+        report(name, tables[name], args.pulls, args.batch, rng)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,49 +1,46 @@
+import json
+import os
+import time
 import requests
-import math
 from random import randint
 
 # Configuration des URLs
 PLAYER_API_URL = "http://localhost:5001"
 AUTH_API_URL = "http://localhost:5000"
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY", "CLE_ADMIN_TRES_SAFE")
 
-def register_user(username, password):
+def provision_user(username, password, level):
     """
-    Enregistre un utilisateur et retourne le token en cas de succès.
+    Crée l'utilisateur directement au niveau voulu via l'endpoint d'administration
+    (au lieu de lui ajouter de l'expérience appel par appel) et retourne son token.
     """
-    register_endpoint = f"{AUTH_API_URL}/register"
-    response = requests.post(register_endpoint, json={"identifiant": username, "password": password})
-    if response.status_code == 201:
-        print("Utilisateur enregistré avec succès.")
-        return response.json()["token"]
-    elif response.status_code == 400 and "déjà utilisé" in response.text.lower():
-        print("Utilisateur déjà enregistré.")
+    response = requests.post(
+        f"{AUTH_API_URL}/admin/users/bulk",
+        data=json.dumps({"identifiant": username, "password": password, "level": level}).encode(),
+        headers={"X-Admin-Key": ADMIN_API_KEY, "Content-Type": "application/x-ndjson"},
+    )
+    if response.status_code != 200:
+        print("Erreur lors du provisionnement :", response.text)
         return None
-    else:
-        print("Erreur lors de l'enregistrement :", response.text)
+    result = json.loads(response.text.splitlines()[0])
+    if "token" not in result:
+        print("Erreur lors du provisionnement :", result.get("error"))
         return None
+    print(f"Utilisateur créé au niveau {level} ({10 + level} emplacements).")
+    return result["token"]
 
-def adjust_inventory_for_summons(token, summon_count):
+def wait_for_player(token, timeout=30):
     """
-    Augmente l'expérience pour obtenir un inventaire suffisant pour le nombre de summons souhaité.
+    Attend que le joueur ait été créé dans PlayerAPI (création asynchrone).
     """
-    experience_endpoint = f"{PLAYER_API_URL}/player/experience"
-    headers = {"Authorization": token, "Content-Type": "application/json"}
-
-    while True:
-        # Ajout d'expérience pour augmenter l'inventaire
-        response = requests.put(experience_endpoint, headers=headers, json={"experience": 5000})
-        if response.status_code != 200:
-            print("Erreur lors de l'ajout d'expérience :", response.text)
-            return False
-
-        player_data = response.json()["player"]
-        max_monsters = player_data["max_monsters"]
-
-        if max_monsters >= summon_count:
-            print(f"L'inventaire est suffisant : {max_monsters} slots disponibles.")
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        response = requests.get(f"{AUTH_API_URL}/register/status", headers={"Authorization": token})
+        if response.status_code == 200 and response.json().get("status") == "done":
             return True
-
-        print(f"Ajout d'expérience. Inventaire actuel : {max_monsters} slots. Objectif : {summon_count} slots.")
+        time.sleep(0.5)
+    print("Le joueur n'a pas été créé à temps.")
+    return False
 
 def summon_monsters(token, summon_count):
     """
@@ -56,6 +53,8 @@ def summon_monsters(token, summon_count):
         response = requests.post(summon_endpoint, headers=headers)
         if response.status_code == 201:
             print(f"Invocation {i + 1} réussie :", response.json())
+        elif response.status_code == 202:
+            print(f"Invocation {i + 1} enregistrée, finalisation différée :", response.json())
         else:
             print(f"Erreur lors de l'invocation {i + 1} :", response.text)
 
@@ -67,20 +66,14 @@ def main():
     username = f"test_user_{randint(1000, 9999)}"
     password = "test_password"
 
-    # Enregistrement de l'utilisateur
-    print("Tentative d'enregistrement...")
-    token = register_user(username, password)
-    if not token:
-        print("Échec de l'enregistrement ou utilisateur déjà enregistré.")
-        return
-
     # Demander le nombre de summons à l'utilisateur
     summon_count = int(input("Entrez le nombre de summons souhaités : "))
 
-    # Vérifier et ajuster l'inventaire
-    print("Vérification de l'inventaire...")
-    if not adjust_inventory_for_summons(token, summon_count):
-        print("Échec de la mise à niveau de l'inventaire.")
+    # Création de l'utilisateur avec un inventaire suffisant (10 + niveau emplacements)
+    print("Tentative de provisionnement...")
+    token = provision_user(username, password, level=max(1, summon_count - 10))
+    if not token or not wait_for_player(token):
+        print("Échec du provisionnement de l'utilisateur.")
         return
 
     # Invoquer les monstres
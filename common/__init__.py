@@ -0,0 +1 @@
+# Modules partagés entre les différentes API (AuthAPI, PlayerAPI, MonstersAPI, SummonAPI, BattleAPI).
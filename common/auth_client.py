@@ -0,0 +1,198 @@
+import os
+import threading
+import time
+from concurrent.futures import Future
+import requests
+
+from common.cache import TTLCache
+from common.tokens import TokenError, TokenSigner, is_signed_token
+
+# Valeur stockée dans le cache pour les tokens refusés par AuthAPI
+_INVALID = ""
+_MISSING = object()
+
+
+class ValidationBatcher:
+    """
+    Regroupe les validations de tokens concurrentes en un seul appel à AuthAPI.
+    Les appels pour un même token partagent la même requête en cours ; les tokens différents
+    soumis pendant la fenêtre `window` (secondes) sont envoyés ensemble dans un seul lot.
+    """
+
+    def __init__(self, fetch_batch, window=0.005, max_batch_size=100):
+        self._fetch_batch = fetch_batch
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._lock = threading.Lock()
+        self._inflight = {}  # token -> Future partagé par tous les appelants
+        self._pending = []  # tokens en attente du prochain lot
+        self.batches = 0
+        self.coalesced = 0
+
+    def submit(self, token):
+        """
+        Retourne un Future résolu avec le nom d'utilisateur (ou None) une fois le lot traité.
+        Le premier appelant d'un lot attend la fin de la fenêtre puis l'envoie lui-même.
+        """
+        with self._lock:
+            future = self._inflight.get(token)
+            if future is not None:
+                self.coalesced += 1
+                return future
+            future = Future()
+            self._inflight[token] = future
+            self._pending.append(token)
+            leader = len(self._pending) == 1
+            full = len(self._pending) >= self.max_batch_size
+
+        if full:
+            self._flush()
+        elif leader:
+            if self.window > 0:
+                time.sleep(self.window)
+            self._flush()
+        return future
+
+    def _flush(self):
+        with self._lock:
+            tokens, self._pending = self._pending, []
+        if not tokens:
+            return
+
+        results, error = None, None
+        try:
+            results = self._fetch_batch(tokens)
+        except Exception as e:
+            error = e
+
+        with self._lock:
+            futures = [self._inflight.pop(token) for token in tokens]
+            self.batches += 1
+        for token, future in zip(tokens, futures):
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(results.get(token))
+
+    def stats(self):
+        return {"batches": self.batches, "coalesced": self.coalesced}
+
+
+class AuthClient:
+    """
+    Client de validation des tokens auprès d'AuthAPI, partagé par tous les services.
+    Les tokens validés (et leur nom d'utilisateur) sont gardés en cache pendant `ttl` secondes,
+    les tokens refusés pendant `negative_ttl` secondes. Les erreurs réseau ne sont jamais mises en cache.
+    Les validations manquant le cache sont regroupées par un ValidationBatcher (`/validate/batch`).
+
+    Si des clés de signature sont configurées (AUTH_SIGNING_KEYS), les tokens signés sont vérifiés
+    localement, sans appel réseau, contre la liste de révocation synchronisée périodiquement.
+    """
+
+    def __init__(self, auth_api_url, ttl=None, negative_ttl=None, max_size=None, timeout=5, signer=None,
+                 revocation_sync_interval=None, batch_window=None):
+        self.auth_api_url = auth_api_url
+        self.timeout = timeout
+        self.signer = signer if signer is not None else TokenSigner.from_env()
+        self.revocation_sync_interval = float(
+            revocation_sync_interval if revocation_sync_interval is not None
+            else os.getenv('REVOCATION_SYNC_INTERVAL', 30)
+        )
+        self._revoked = frozenset()
+        self._revoked_synced_at = None
+        self._revocation_lock = threading.Lock()
+        self.local_validations = 0
+        self._batcher = ValidationBatcher(
+            self._fetch_batch,
+            window=float(batch_window if batch_window is not None else os.getenv('AUTH_BATCH_WINDOW_MS', 5)) / 1000,
+        )
+        self.negative_ttl = float(negative_ttl if negative_ttl is not None else os.getenv('AUTH_CACHE_NEGATIVE_TTL', 5))
+        self._cache = TTLCache(
+            max_size=int(max_size if max_size is not None else os.getenv('AUTH_CACHE_MAX_SIZE', 10000)),
+            ttl=float(ttl if ttl is not None else os.getenv('AUTH_CACHE_TTL', 30)),
+        )
+
+    def validate(self, token):
+        """
+        Retourne le nom d'utilisateur associé au token, ou None s'il est invalide ou expiré.
+        """
+        if self.signer is not None and is_signed_token(token):
+            return self._validate_signed(token)
+
+        cached = self._cache.get(token, _MISSING)
+        if cached is not _MISSING:
+            return cached or None
+
+        try:
+            return self._batcher.submit(token).result(timeout=self.timeout + self._batcher.window)
+        except Exception as e:
+            print(f"Erreur lors de la validation du token : {e}")
+            return None
+
+    def invalidate(self, token):
+        """
+        Retire un token du cache (par exemple après une déconnexion).
+        """
+        self._cache.pop(token)
+
+    def stats(self):
+        stats = self._cache.stats()
+        stats["local_validations"] = self.local_validations
+        stats["revoked_tokens"] = len(self._revoked)
+        stats.update(self._batcher.stats())
+        return stats
+
+    def _validate_signed(self, token):
+        try:
+            claims = self.signer.verify(token)
+        except TokenError as e:
+            print(f"Token signé refusé : {e}")
+            return None
+        self._sync_revocations()
+        if claims.get("jti") in self._revoked:
+            print("Token signé révoqué.")
+            return None
+        self.local_validations += 1
+        return claims["sub"]
+
+    def _sync_revocations(self):
+        """
+        Rafraîchit la liste de révocation si elle est plus ancienne que l'intervalle de synchronisation.
+        Un seul thread effectue l'appel ; les autres continuent avec la liste courante.
+        En cas d'échec, la liste courante est conservée jusqu'à la tentative suivante.
+        """
+        now = time.monotonic()
+        if self._revoked_synced_at is not None and now - self._revoked_synced_at < self.revocation_sync_interval:
+            return
+        if not self._revocation_lock.acquire(blocking=False):
+            return
+        try:
+            response = requests.get(f"{self.auth_api_url}/revoked", timeout=self.timeout)
+            if response.status_code == 200:
+                self._revoked = frozenset(response.json().get("revoked", []))
+            else:
+                print(f"Erreur lors de la synchronisation des révocations : {response.text}")
+        except requests.exceptions.RequestException as e:
+            print(f"Erreur lors de la synchronisation des révocations : {e}")
+        finally:
+            self._revoked_synced_at = now
+            self._revocation_lock.release()
+
+    def _fetch_batch(self, tokens):
+        """
+        Valide un lot de tokens en un seul appel et met les réponses en cache.
+        """
+        print(f"Validation de {len(tokens)} token(s) auprès de l'API Auth...")
+        response = requests.post(f"{self.auth_api_url}/validate/batch", json={"tokens": tokens}, timeout=self.timeout)
+        if response.status_code != 200:
+            # Erreur côté AuthAPI : on ne met pas la réponse en cache
+            raise requests.exceptions.HTTPError(f"AuthAPI a répondu {response.status_code}", response=response)
+
+        results = response.json().get("results", {})
+        for token in tokens:
+            username = results.get(token)
+            if username:
+                self._cache.set(token, username)
+            else:
+                self._cache.set(token, _INVALID, ttl=self.negative_ttl)
+        return results
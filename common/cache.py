@@ -0,0 +1,94 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Cache LRU borné dont chaque entrée expire après un délai (TTL).
+    Utilisable depuis plusieurs threads et instrumenté (hits, misses, évictions).
+    """
+
+    def __init__(self, max_size=1024, ttl=30.0, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()  # clé -> (valeur, date d'expiration)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale_fills = 0
+        self._generation = 0  # Incrémenté à chaque invalidation (voir `generation`)
+
+    def get(self, key, default=None):
+        """
+        Retourne la valeur associée à la clé, ou `default` si elle est absente ou expirée.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > self._clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def generation(self):
+        """
+        Numéro d'invalidation courant, à relever avant de lire la source d'une entrée à mettre en cache :
+        passé à `set`, il empêche de remettre en cache une valeur lue avant une invalidation concurrente.
+        """
+        with self._lock:
+            return self._generation
+
+    def set(self, key, value, ttl=None, generation=None):
+        """
+        Ajoute ou remplace une entrée. `ttl` permet de surcharger la durée de vie par défaut.
+        Avec `generation`, l'entrée est ignorée si une invalidation a eu lieu depuis ce numéro.
+        """
+        expires_at = self._clock() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                self.stale_fills += 1
+                return
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key):
+        """
+        Supprime une entrée (sans erreur si elle n'existe pas).
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+            self._generation += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """
+        Compteurs exposés par les endpoints /metrics.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "stale_fills": self.stale_fills,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,227 @@
+import datetime
+import hashlib
+import json
+import os
+import threading
+import time
+
+import requests
+from flask import make_response, request
+
+# Catalogue des monstres de base partagé par SummonAPI et MonstersAPI (copié avec common/ dans les images,
+# et monté depuis le dépôt par docker-compose pour que les deux conteneurs lisent le même fichier)
+DEFAULT_CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data.json")
+
+
+def content_hash(data):
+    """
+    Empreinte stable d'une valeur JSON (indépendante de l'ordre des clés).
+    """
+    return hashlib.sha256(json.dumps(data, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+class CatalogVersion:
+    """
+    Version figée du catalogue : liste des monstres, empreinte du contenu (`version`, aussi utilisée
+    comme ETag) et corps JSON précalculé pour `GET /catalog`. Une version n'est jamais modifiée ;
+    les consommateurs doivent la traiter en lecture seule.
+    """
+
+    __slots__ = ("version", "monsters", "body", "loaded_at")
+
+    def __init__(self, monsters):
+        self.version = content_hash(monsters)
+        self.monsters = tuple(monsters)
+        self.body = json.dumps({"version": self.version, "monsters": monsters}).encode()
+        self.loaded_at = datetime.datetime.now()
+
+    def __len__(self):
+        return len(self.monsters)
+
+
+class Catalog:
+    """
+    Catalogue chargé en mémoire depuis un fichier JSON, rechargé à chaud.
+
+    Chaque chargement produit une nouvelle `CatalogVersion` qui remplace `current` en une seule
+    affectation : un lecteur voit l'ancienne version ou la nouvelle, jamais un état intermédiaire.
+    Le fichier est surveillé (date de modification, toutes les `poll_interval` secondes) et peut être
+    relu à la demande via `reload`. Les fonctions abonnées (`subscribe`) sont appelées à chaque
+    nouvelle version ; un fichier invalide est ignoré et la version courante conservée.
+    """
+
+    def __init__(self, path=DEFAULT_CATALOG_PATH, poll_interval=5.0):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.current = None
+        self.reloads = 0
+        self.errors = 0
+        self._mtime = None
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def subscribe(self, listener):
+        """
+        Abonne `listener(version)` aux nouvelles versions (appelé tout de suite si une version est chargée).
+        """
+        with self._lock:
+            self._listeners.append(listener)
+            if self.current is not None:
+                listener(self.current)
+
+    def reload(self, force=False):
+        """
+        Relit le fichier s'il a été modifié (toujours si `force`).
+        Retourne (version courante ou None, True si une nouvelle version a été chargée).
+        """
+        with self._lock:
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError as e:
+                self.errors += 1
+                print(f"Catalogue {self.path} introuvable : {e}")
+                return self.current, False
+            if not force and mtime == self._mtime:
+                return self.current, False
+            self._mtime = mtime
+
+            try:
+                with open(self.path, "r") as file:
+                    monsters = json.load(file)
+                if not isinstance(monsters, list) or not monsters:
+                    raise ValueError("le catalogue doit être une liste non vide de monstres")
+            except (OSError, ValueError) as e:
+                self.errors += 1
+                print(f"Erreur lors du chargement du catalogue {self.path}, version courante conservée : {e}")
+                return self.current, False
+
+            if self.current is not None and content_hash(monsters) == self.current.version:
+                return self.current, False
+            version = CatalogVersion(monsters)
+            self.current = version
+            self.reloads += 1
+            print(f"Catalogue version {version.version[:12]} chargé : {len(version)} monstre(s).")
+            # Notification sous le verrou : les abonnés reçoivent les versions dans l'ordre
+            for listener in self._listeners:
+                try:
+                    listener(version)
+                except Exception as e:
+                    print(f"Erreur lors de la prise en compte du catalogue {version.version[:12]} : {e}")
+            return version, True
+
+    def start(self):
+        """
+        Lance la surveillance du fichier (sans effet si `poll_interval` vaut 0).
+        """
+        if self._thread is not None or self.poll_interval <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, name="catalog-watch", daemon=True)
+        self._thread.start()
+
+    def stats(self):
+        current = self.current
+        return {
+            "version": current.version if current else None,
+            "monsters": len(current) if current else 0,
+            "loaded_at": current.loaded_at.isoformat() if current else None,
+            "reloads": self.reloads,
+            "errors": self.errors,
+        }
+
+    def _run(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self.reload()
+            except Exception as e:
+                print(f"Erreur dans la surveillance du catalogue : {e}")
+
+
+class CatalogPeer:
+    """
+    Version du catalogue servie par un autre service (`GET /catalog`), suivie pour détecter une
+    divergence avec le catalogue local. Le service est interrogé toutes les `poll_interval` secondes
+    (ou dès `wake`) avec If-None-Match : tant que sa version ne change pas, il répond 304 sans corps.
+    `version` vaut None tant que le service n'a jamais répondu ; la dernière version connue est
+    conservée s'il devient injoignable.
+    """
+
+    def __init__(self, url, poll_interval=5.0, timeout=5):
+        self.url = url
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.version = None
+        self.checked_at = None
+        self.errors = 0
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def check(self):
+        """
+        Interroge le service. Retourne sa version du catalogue (None si inconnue).
+        """
+        headers = {"If-None-Match": f'"{self.version}"'} if self.version else {}
+        try:
+            response = requests.get(self.url, headers=headers, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            self.errors += 1
+            print(f"Erreur de communication avec {self.url} : {e}")
+            return self.version
+        if response.status_code == 200:
+            version = response.json()["version"]
+            if version != self.version:
+                print(f"Catalogue de {self.url} : version {version[:12]}.")
+            self.version = version
+        elif response.status_code != 304:
+            self.errors += 1
+            print(f"{self.url} a répondu {response.status_code} : {response.text}")
+            return self.version
+        self.checked_at = datetime.datetime.utcnow()
+        return self.version
+
+    def diverges(self, version):
+        """
+        True si la version du service est connue et différente de `version`.
+        """
+        return self.version is not None and self.version != version
+
+    def wake(self):
+        self._wakeup.set()
+
+    def start(self):
+        """
+        Lance le suivi en arrière-plan (sans effet si `poll_interval` vaut 0).
+        """
+        if self._thread is not None or self.poll_interval <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, name="catalog-peer", daemon=True)
+        self._thread.start()
+
+    def stats(self):
+        return {
+            "version": self.version,
+            "checked_at": self.checked_at.isoformat() if self.checked_at else None,
+            "errors": self.errors,
+        }
+
+    def _run(self):
+        while True:
+            try:
+                self.check()
+            except Exception as e:
+                print(f"Erreur dans le suivi du catalogue de {self.url} : {e}")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+
+def catalog_response(version):
+    """
+    Réponse Flask de `GET /catalog` : corps précalculé de la version avec son ETag,
+    ou 304 sans corps si le client possède déjà cette version (header If-None-Match).
+    """
+    response = make_response(version.body)
+    response.mimetype = "application/json"
+    response.set_etag(version.version)
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
@@ -0,0 +1,163 @@
+import datetime
+import functools
+import hashlib
+import threading
+import time
+
+from flask import jsonify, make_response, request
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError
+
+HEADER = "Idempotency-Key"
+
+
+class IdempotencyStore:
+    """
+    Clés d'idempotence des requêtes POST (header `Idempotency-Key`), stockées dans une collection Mongo.
+
+    La première requête portant une clé la verrouille ("in_progress") puis y enregistre sa réponse ;
+    les doublons reçoivent la réponse enregistrée au lieu de refaire le traitement. Un doublon qui
+    arrive pendant le traitement attend son résultat (au plus `wait_timeout` secondes). Les entrées
+    expirent via un index TTL : `ttl` secondes après la réponse, `lock_ttl` secondes pour un verrou
+    abandonné (arrêt du service en cours de traitement), qui peut alors être repris. Tant que le
+    traitement dure, le verrou est prolongé toutes les `lock_ttl / 3` secondes : un traitement lent
+    (appels HTTP en chaîne) ne le perd pas. Les dates d'expiration sont en UTC, l'heure de référence
+    de l'index TTL.
+    """
+
+    def __init__(self, collection, ttl=86400, lock_ttl=60, wait_timeout=10, poll_interval=0.05):
+        self.collection = collection
+        self.ttl = ttl
+        self.lock_ttl = lock_ttl
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self.replayed = 0
+        self.waited = 0
+
+    def ensure_indexes(self):
+        try:
+            self.collection.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+        except Exception as e:
+            print(f"Erreur lors de la création de l'index {self.collection.name} expires_at : {e}")
+
+    def begin(self, entry_id, fingerprint):
+        """
+        Verrouille la clé ou récupère la réponse déjà enregistrée.
+        Retourne ("new", None), ("replay", (corps, code)), ("conflict", None) si la clé a servi
+        pour une autre requête, ou ("busy", None) si le traitement concurrent ne s'est pas terminé à temps.
+        """
+        deadline = time.monotonic() + self.wait_timeout
+        waited = False
+        while True:
+            now = datetime.datetime.utcnow()
+            try:
+                self.collection.insert_one({
+                    "_id": entry_id,
+                    "status": "in_progress",
+                    "fingerprint": fingerprint,
+                    "expires_at": now + datetime.timedelta(seconds=self.lock_ttl),
+                })
+                return "new", None
+            except DuplicateKeyError:
+                pass
+
+            entry = self.collection.find_one({"_id": entry_id})
+            if entry is None:
+                # Entrée expirée entre-temps : nouvelle tentative de verrouillage
+                continue
+            if entry["fingerprint"] != fingerprint:
+                return "conflict", None
+            if entry["status"] == "completed":
+                self.replayed += 1
+                self.waited += waited
+                return "replay", (entry["response"]["body"], entry["response"]["status"])
+            if entry["expires_at"] <= now:
+                # Verrou abandonné : reprise du traitement par cette requête
+                taken = self.collection.update_one(
+                    {"_id": entry_id, "status": "in_progress", "expires_at": entry["expires_at"]},
+                    {"$set": {"expires_at": now + datetime.timedelta(seconds=self.lock_ttl)}},
+                )
+                if taken.modified_count:
+                    return "new", None
+            if time.monotonic() >= deadline:
+                return "busy", None
+            waited = True
+            time.sleep(self.poll_interval)
+
+    def renew(self, entry_id):
+        """
+        Prolonge le verrou d'un traitement en cours. Retourne False s'il n'est plus détenu.
+        """
+        result = self.collection.update_one(
+            {"_id": entry_id, "status": "in_progress"},
+            {"$set": {"expires_at": datetime.datetime.utcnow() + datetime.timedelta(seconds=self.lock_ttl)}},
+        )
+        return result.modified_count > 0
+
+    def _keep_alive(self, entry_id, done):
+        while not done.wait(self.lock_ttl / 3):
+            try:
+                if not self.renew(entry_id):
+                    return
+            except Exception as e:
+                print(f"Erreur lors de la prolongation du verrou d'idempotence {entry_id} : {e}")
+
+    def complete(self, entry_id, body, status):
+        self.collection.update_one({"_id": entry_id}, {"$set": {
+            "status": "completed",
+            "response": {"body": body, "status": status},
+            "expires_at": datetime.datetime.utcnow() + datetime.timedelta(seconds=self.ttl),
+        }})
+
+    def release(self, entry_id):
+        """
+        Libère la clé sans enregistrer de réponse (erreur serveur) : un nouvel essai refera le traitement.
+        """
+        self.collection.delete_one({"_id": entry_id, "status": "in_progress"})
+
+    def stats(self):
+        return {"replayed": self.replayed, "waited": self.waited}
+
+    def idempotent(self, view):
+        """
+        Décorateur de vue Flask : applique l'idempotence si la requête porte le header `Idempotency-Key`.
+        La clé est propre à chaque utilisateur (`request.username`) ; les réponses 5xx ne sont pas enregistrées.
+        """
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            key = request.headers.get(HEADER)
+            if not key:
+                return view(*args, **kwargs)
+            if len(key) > 255:
+                return jsonify({"error": f"Le header {HEADER} est trop long."}), 400
+
+            entry_id = f"{request.username}:{request.path}:{key}"
+            fingerprint = hashlib.sha256(
+                request.method.encode() + request.full_path.encode() + request.get_data()
+            ).hexdigest()
+            state, stored = self.begin(entry_id, fingerprint)
+            if state == "replay":
+                response = make_response(jsonify(stored[0]), stored[1])
+                response.headers["Idempotent-Replayed"] = "true"
+                return response
+            if state == "conflict":
+                return jsonify({"error": f"{HEADER} déjà utilisée pour une requête différente."}), 422
+            if state == "busy":
+                return jsonify({"error": "Une requête identique est en cours de traitement, réessayez."}), 409
+
+            done = threading.Event()
+            threading.Thread(target=self._keep_alive, args=(entry_id, done), name="idempotency-lock", daemon=True).start()
+            try:
+                response = make_response(view(*args, **kwargs))
+            except Exception:
+                self.release(entry_id)
+                raise
+            finally:
+                done.set()
+            if response.status_code >= 500 or not response.is_json:
+                self.release(entry_id)
+            else:
+                self.complete(entry_id, response.get_json(), response.status_code)
+            return response
+
+        return wrapper
@@ -0,0 +1,12 @@
+def ensure_indexes(indexes):
+    """
+    Crée les index manquants (opération sans effet s'ils existent déjà) et journalise leur état.
+    `indexes` : liste de (collection, clés, options de create_index).
+    Un échec n'empêche pas le démarrage : le service fonctionne, plus lentement, sans l'index.
+    """
+    for collection, keys, options in indexes:
+        try:
+            name = collection.create_index(keys, **options)
+            print(f"Index {collection.name}.{name} prêt.")
+        except Exception as e:
+            print(f"Erreur lors de la création de l'index {collection.name} {keys} : {e}")
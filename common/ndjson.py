@@ -0,0 +1,33 @@
+import json
+
+
+def parse_ndjson(text):
+    """
+    Décode un corps NDJSON (un objet JSON par ligne, lignes vides ignorées).
+    Lève ValueError en indiquant la ligne fautive.
+    """
+    items = []
+    for line_number, line in enumerate(text.splitlines(), start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"Ligne {line_number} : JSON invalide ({e}).")
+        if not isinstance(item, dict):
+            raise ValueError(f"Ligne {line_number} : un objet JSON est attendu.")
+        items.append(item)
+    return items
+
+
+def dump_ndjson_line(item):
+    return json.dumps(item, ensure_ascii=False) + "\n"
+
+
+def chunked(items, size):
+    """
+    Découpe une liste en morceaux de `size` éléments au plus.
+    """
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
@@ -0,0 +1,81 @@
+import datetime
+import threading
+
+import requests
+
+from common.ndjson import dump_ndjson_line
+
+
+def post_ndjson(url, items, admin_api_key, service, timeout=30):
+    """
+    Envoie `items` en NDJSON à un endpoint d'administration (header X-Admin-Key).
+    Retourne (réponse, None) si le service répond 200, sinon (None, message d'erreur).
+    """
+    body = "".join(dump_ndjson_line(item) for item in items)
+    try:
+        response = requests.post(
+            url,
+            data=body.encode(),
+            headers={"X-Admin-Key": admin_api_key, "Content-Type": "application/x-ndjson"},
+            timeout=timeout,
+        )
+    except requests.exceptions.RequestException as e:
+        return None, f"Erreur de communication avec {service} : {e}"
+    if response.status_code != 200:
+        return None, f"{service} a répondu {response.status_code} : {response.text}"
+    return response, None
+
+
+class OutboxWorker:
+    """
+    Base des workers d'outbox : un thread vide la file par lots (`drain`, à définir) toutes les
+    `interval` secondes ou dès qu'il est réveillé (`wake`), tant que des lots complets sont disponibles.
+    Les échecs sont rejoués avec un délai qui double à chaque tentative (`retry_at`), borné à `max_backoff`.
+    """
+
+    name = "outbox"
+
+    def __init__(self, interval=2.0, batch_size=100, max_backoff=300):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_backoff = max_backoff
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def wake(self):
+        self._wakeup.set()
+
+    def drain(self):
+        """
+        Traite un lot de la file. Retourne le nombre d'éléments traités.
+        """
+        raise NotImplementedError
+
+    def tick(self):
+        """
+        Tâche périodique exécutée avant chaque vidage de la file (aucune par défaut).
+        """
+
+    def retry_at(self, now, attempts):
+        """
+        Date du prochain essai après `attempts` échecs.
+        """
+        return now + datetime.timedelta(seconds=min(2 ** attempts, self.max_backoff))
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.tick()
+                # Vide la file tant que des lots complets sont disponibles
+                while self.drain() >= self.batch_size:
+                    pass
+            except Exception as e:
+                print(f"Erreur dans le worker {self.name} : {e}")
@@ -0,0 +1,82 @@
+import bisect
+import math
+from collections import namedtuple
+
+# Courbe d'expérience commune aux joueurs et aux monstres : passer du niveau l à l+1 coûte 50 * 1.1^l XP
+BASE_XP = 50
+GROWTH = 1.1
+MAX_LEVEL = 200
+
+# Gains de statistiques d'un monstre à chaque niveau
+MONSTER_LEVEL_UP_GAINS = {"hp": 10, "atk": 5, "def": 3, "vit": 2, "skill_points": 1}
+
+
+def _threshold(level):
+    # Arrondi avant le plafond pour absorber les erreurs de flottant (50 * 1.1 = 55.00000000000001)
+    return math.ceil(round(BASE_XP * GROWTH ** level, 6))
+
+
+# XP_TO_NEXT[l] : XP nécessaire pour passer du niveau l au niveau l+1 (l >= 1)
+XP_TO_NEXT = [0] + [_threshold(level) for level in range(1, MAX_LEVEL)]
+
+# CUMULATIVE_XP[l] : XP totale accumulée depuis le niveau 1 pour atteindre le niveau l
+CUMULATIVE_XP = [0, 0]
+for _level in range(1, MAX_LEVEL):
+    CUMULATIVE_XP.append(CUMULATIVE_XP[-1] + XP_TO_NEXT[_level])
+
+Progress = namedtuple("Progress", ["level", "experience", "levels_gained"])
+
+
+def xp_to_next_level(level):
+    """
+    XP nécessaire pour passer du niveau `level` au suivant (seuil du dernier niveau au-delà du maximum).
+    """
+    return XP_TO_NEXT[max(1, min(level, MAX_LEVEL - 1))]
+
+
+def resolve(level, experience, gain):
+    """
+    Applique un gain d'XP en une seule recherche dichotomique dans la table cumulée.
+    Retourne Progress(niveau final, XP restante dans ce niveau, niveaux gagnés).
+    """
+    level = max(1, min(level, MAX_LEVEL))
+    total = CUMULATIVE_XP[level] + experience + gain
+    new_level = max(level, min(bisect.bisect_right(CUMULATIVE_XP, total, 1) - 1, MAX_LEVEL))
+    return Progress(new_level, total - CUMULATIVE_XP[new_level], new_level - level)
+
+
+def stat_gains(levels_gained, gains=MONSTER_LEVEL_UP_GAINS):
+    """
+    Statistiques gagnées par un monstre pour `levels_gained` niveaux.
+    """
+    return {stat: value * levels_gained for stat, value in gains.items()}
+
+
+def experience_update_pipeline(gain, per_level_gains=None, extra_fields=None):
+    """
+    Pipeline de mise à jour Mongo équivalent à `resolve`, appliqué atomiquement côté serveur
+    sur un document portant `level` et `experience`.
+      - per_level_gains : champs incrémentés de valeur * niveaux gagnés (ex. MONSTER_LEVEL_UP_GAINS)
+      - extra_fields : expressions calculées à partir de "$_new_level" (ex. capacité d'inventaire)
+    """
+    # cumulative[i] = CUMULATIVE_XP[i + 1] : le niveau atteint est le nombre de paliers franchis
+    cumulative = {"$literal": CUMULATIVE_XP[1:]}
+    final_fields = {
+        "level": "$_new_level",
+        "experience": {"$subtract": ["$_total_xp", {"$arrayElemAt": [cumulative, {"$subtract": ["$_new_level", 1]}]}]},
+    }
+    for field, value in (per_level_gains or {}).items():
+        final_fields[field] = {"$add": [{"$ifNull": [f"${field}", 0]}, {"$multiply": [value, "$_levels_gained"]}]}
+    final_fields.update(extra_fields or {})
+
+    return [
+        {"$set": {"_total_xp": {"$add": [
+            {"$arrayElemAt": [cumulative, {"$subtract": ["$level", 1]}]}, "$experience", gain,
+        ]}}},
+        {"$set": {"_new_level": {"$max": ["$level", {"$size": {
+            "$filter": {"input": cumulative, "cond": {"$lte": ["$$this", "$_total_xp"]}},
+        }}]}}},
+        {"$set": {"_levels_gained": {"$subtract": ["$_new_level", "$level"]}}},
+        {"$set": final_fields},
+        {"$unset": ["_total_xp", "_new_level", "_levels_gained"]},
+    ]
@@ -0,0 +1,72 @@
+import re
+
+FIELD_NAME_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)*$")
+
+
+def parse_fields(value):
+    """
+    Convertit le paramètre `fields` (noms séparés par des virgules, notation pointée acceptée)
+    en projection Mongo. Retourne None si le paramètre est absent (document complet) ;
+    lève ValueError si un nom est invalide ou si un champ en contient un autre (`skills` et
+    `skills.dmg`), combinaison refusée par Mongo.
+    """
+    if not value:
+        return None
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    invalid = [field for field in fields if not FIELD_NAME_PATTERN.match(field)]
+    if invalid:
+        raise ValueError(f"Champ(s) invalide(s) : {', '.join(invalid)}")
+    collisions = sorted({field for field in fields for other in fields if other.startswith(field + ".")})
+    if collisions:
+        raise ValueError(f"Champ(s) en conflit avec un sous-champ : {', '.join(collisions)}")
+    return {field: 1 for field in fields}
+
+
+def _projection_tree(projection):
+    """
+    Arbre des chemins de la projection : {"skills": {"dmg": True}, "level": True}.
+    """
+    tree = {}
+    for field in projection:
+        node = tree
+        *parents, leaf = field.split(".")
+        for name in parents:
+            node = node.setdefault(name, {})
+        node[leaf] = True
+    return tree
+
+
+def _project_value(value, tree):
+    """
+    Projette une valeur sur un sous-arbre comme Mongo : un sous-document est filtré, un tableau
+    l'est élément par élément (les valeurs scalaires en sont retirées), un scalaire est omis (None).
+    """
+    if isinstance(value, dict):
+        result = {}
+        for name, subtree in tree.items():
+            if name not in value:
+                continue
+            if subtree is True:
+                result[name] = value[name]
+            else:
+                projected = _project_value(value[name], subtree)
+                if projected is not None:
+                    result[name] = projected
+        return result
+    if isinstance(value, list):
+        return [_project_value(item, tree) for item in value if isinstance(item, (dict, list))]
+    return None
+
+
+def project(document, projection):
+    """
+    Applique en Python une projection produite par `parse_fields` à un document déjà chargé
+    (entrée de cache par exemple), avec le même résultat que Mongo, y compris pour un chemin
+    pointé qui traverse un tableau (`skills.dmg`). `_id` est conservé, comme avec Mongo.
+    """
+    if projection is None:
+        return document
+    result = _project_value(document, _projection_tree(projection))
+    if "_id" in document:
+        result = {"_id": document["_id"], **result}
+    return result
@@ -0,0 +1,60 @@
+import hashlib
+import random
+import threading
+
+from flask import request
+
+from common.idempotency import HEADER as IDEMPOTENCY_HEADER
+
+# Header fixant la clé du flux aléatoire d'une requête (mode déterministe)
+HEADER = "X-RNG-Key"
+
+
+class RngStreams:
+    """
+    Fabrique de générateurs aléatoires indépendants (`random.Random`), un par requête ou par objet :
+    aucun générateur global partagé entre les threads.
+
+    Sans graine maître, chaque flux est initialisé depuis l'entropie du système. Avec une graine maître
+    (mode déterministe, pour les benchmarks et les tests de non-régression), la graine d'un flux est
+    l'empreinte SHA-256 de (graine maître, clé) : une même clé rejoue exactement la même séquence.
+    """
+
+    def __init__(self, master_seed=None):
+        self.master_seed = master_seed
+        self._sequences = {}  # portée -> nombre de flux déjà attribués sans clé explicite
+        self._lock = threading.Lock()
+
+    @property
+    def deterministic(self):
+        return self.master_seed is not None
+
+    def stream(self, *key):
+        """
+        Flux associé à `key` : toujours le même en mode déterministe, indépendant sinon.
+        """
+        if not self.deterministic:
+            return random.Random()
+        digest = hashlib.sha256(repr((self.master_seed,) + key).encode()).digest()
+        return random.Random(int.from_bytes(digest, "big"))
+
+    def for_request(self, *scope):
+        """
+        Flux de la requête Flask en cours, dans la portée `scope` (par exemple utilisateur et endpoint).
+        En mode déterministe, la clé est le header X-RNG-Key, à défaut le header Idempotency-Key
+        (un rejeu tire la même chose), à défaut le numéro d'ordre de la requête dans sa portée
+        depuis le démarrage du service.
+        """
+        if not self.deterministic:
+            return random.Random()
+        key = request.headers.get(HEADER) or request.headers.get(IDEMPOTENCY_HEADER)
+        if key:
+            return self.stream(*scope, "key", key)
+        with self._lock:
+            sequence = self._sequences.get(scope, 0)
+            self._sequences[scope] = sequence + 1
+        return self.stream(*scope, "sequence", sequence)
+
+    def stats(self):
+        with self._lock:
+            return {"deterministic": self.deterministic, "sequenced_scopes": len(self._sequences)}
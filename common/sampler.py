@@ -0,0 +1,60 @@
+import random
+
+
+class AliasTable:
+    """
+    Table d'alias de Walker (construction de Vose) : tirage pondéré en O(1), sans parcours
+    cumulatif ni accumulation d'erreurs d'arrondi.
+
+    La table est immuable une fois construite ; pour changer les poids, on en construit une
+    nouvelle et on remplace la référence (échange atomique pour les threads qui tirent).
+    """
+
+    def __init__(self, items, weights):
+        items, weights = list(items), [float(weight) for weight in weights]
+        if not items or len(items) != len(weights):
+            raise ValueError("Il faut autant de poids que d'éléments, et au moins un élément.")
+        if any(weight < 0 for weight in weights):
+            raise ValueError("Les poids doivent être positifs ou nuls.")
+        total = sum(weights)
+        if total <= 0:
+            raise ValueError("La somme des poids doit être strictement positive.")
+
+        n = len(items)
+        self.items = items
+        self.probabilities = [weight / total for weight in weights]
+        self._threshold = [0.0] * n
+        self._alias = list(range(n))
+
+        scaled = [probability * n for probability in self.probabilities]
+        small = [i for i, value in enumerate(scaled) if value < 1.0]
+        large = [i for i, value in enumerate(scaled) if value >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self._threshold[less] = scaled[less]
+            self._alias[less] = more
+            scaled[more] = (scaled[more] + scaled[less]) - 1.0
+            (small if scaled[more] < 1.0 else large).append(more)
+        # Restes dus aux arrondis : probabilité 1 de garder la case
+        for i in small + large:
+            self._threshold[i] = 1.0
+
+    def __len__(self):
+        return len(self.items)
+
+    def columns(self):
+        """
+        Colonnes de la table (seuils, alias), pour un tirage vectorisé équivalent à `sample_index` :
+        colonne uniforme c, puis c si u < seuils[c], sinon alias[c].
+        """
+        return list(self._threshold), list(self._alias)
+
+    def sample_index(self, rng=random):
+        column = rng.randrange(len(self.items))
+        return column if rng.random() < self._threshold[column] else self._alias[column]
+
+    def sample(self, rng=random):
+        """
+        Tire un élément selon les poids de la table.
+        """
+        return self.items[self.sample_index(rng)]
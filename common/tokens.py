@@ -0,0 +1,120 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+
+# Format d'un token signé : v1.<id de clé>.<payload base64>.<signature base64>
+SIGNED_TOKEN_VERSION = "v1"
+
+
+class TokenError(Exception):
+    """
+    Token signé mal formé, falsifié ou expiré.
+    """
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def is_signed_token(token):
+    """
+    Indique si le token a le format d'un token signé (les tokens opaques sont des hash hexadécimaux).
+    """
+    return isinstance(token, str) and token.startswith(SIGNED_TOKEN_VERSION + ".")
+
+
+def parse_keyring(spec):
+    """
+    Lit un trousseau de clés au format "id1:secret1,id2:secret2".
+    """
+    keys = {}
+    for item in (spec or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        key_id, _, secret = item.partition(":")
+        if not key_id or not secret:
+            raise ValueError(f"Clé de signature invalide : {key_id or item!r}")
+        keys[key_id] = secret.encode()
+    return keys
+
+
+class TokenSigner:
+    """
+    Signe et vérifie des tokens HMAC-SHA256 portant le nom d'utilisateur et une date d'expiration.
+    Toutes les clés du trousseau sont acceptées en vérification, seule la clé active signe :
+    une rotation consiste à ajouter la nouvelle clé partout, l'activer, puis retirer l'ancienne
+    une fois ses tokens expirés.
+    """
+
+    def __init__(self, keys, active_key_id=None):
+        if not keys:
+            raise ValueError("Au moins une clé de signature est requise.")
+        self.keys = dict(keys)
+        self.active_key_id = active_key_id or next(iter(self.keys))
+        if self.active_key_id not in self.keys:
+            raise ValueError(f"Clé active inconnue : {self.active_key_id}")
+
+    @classmethod
+    def from_env(cls):
+        """
+        Construit le signataire depuis AUTH_SIGNING_KEYS / AUTH_ACTIVE_KEY_ID, ou retourne None si non configuré.
+        """
+        keys = parse_keyring(os.getenv('AUTH_SIGNING_KEYS', ''))
+        if not keys:
+            return None
+        return cls(keys, os.getenv('AUTH_ACTIVE_KEY_ID') or None)
+
+    def _signature(self, key_id, signing_input):
+        return hmac.new(self.keys[key_id], signing_input.encode(), hashlib.sha256).digest()
+
+    def sign(self, username, ttl):
+        """
+        Génère un token signé valable `ttl` secondes. Retourne (token, claims).
+        """
+        claims = {
+            "sub": username,
+            "exp": int(time.time() + ttl),
+            "jti": secrets.token_hex(8),
+        }
+        payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+        signing_input = f"{SIGNED_TOKEN_VERSION}.{self.active_key_id}.{payload}"
+        token = f"{signing_input}.{_b64encode(self._signature(self.active_key_id, signing_input))}"
+        return token, claims
+
+    def verify(self, token, now=None):
+        """
+        Vérifie la signature et l'expiration du token et retourne ses claims.
+        Lève TokenError si le token est invalide.
+        """
+        try:
+            version, key_id, payload, signature = token.split(".")
+        except (AttributeError, ValueError):
+            raise TokenError("Token mal formé.")
+        if version != SIGNED_TOKEN_VERSION:
+            raise TokenError("Version de token inconnue.")
+        if key_id not in self.keys:
+            raise TokenError("Clé de signature inconnue.")
+
+        expected = self._signature(key_id, f"{version}.{key_id}.{payload}")
+        try:
+            valid = hmac.compare_digest(expected, _b64decode(signature))
+            claims = json.loads(_b64decode(payload)) if valid else None
+        except (ValueError, TypeError):
+            raise TokenError("Token mal formé.")
+        if not valid:
+            raise TokenError("Signature invalide.")
+
+        if not isinstance(claims, dict) or not claims.get("sub") or "exp" not in claims:
+            raise TokenError("Token incomplet.")
+        if (now if now is not None else time.time()) >= claims["exp"]:
+            raise TokenError("Token expiré.")
+        return claims
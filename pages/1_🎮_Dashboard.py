@@ -25,7 +25,7 @@ st.markdown("""
 import plotly.graph_objects as go
 import requests
 from constants import *
-from utils import display_player_stats, setup_navigation
+from utils import display_player_stats, fetch_monsters, setup_navigation
 import time
 
 # Vérification de l'authentification avant tout
@@ -286,8 +286,12 @@ def display_monster_details(monster_id):
                 st.plotly_chart(fig, use_container_width=True)
             
             st.subheader("Compétences")
+            # Améliorations en attente pour ce monstre : {index de compétence: niveaux}, validées en un seul appel
+            queue = st.session_state.setdefault("skill_queue", {}).setdefault(monster_id, {})
+            remaining_points = monster['skill_points'] - sum(queue.values())
             for i, skill in enumerate(monster['skills']):
-                with st.expander(f"Compétence {i+1} - Niveau {skill.get('level', 1)}/{skill['lvlMax']}"):
+                queued = queue.get(i, 0)
+                with st.expander(f"Compétence {i+1} - Niveau {skill.get('level', 1)}/{skill['lvlMax']}" + (f" (+{queued} en attente)" if queued else "")):
                     col1, col2 = st.columns(2)
                     with col1:
                         st.markdown(f"""
@@ -308,22 +312,35 @@ def display_monster_details(monster_id):
                         """, unsafe_allow_html=True)
                     
                     with col2:
-                        if monster['skill_points'] > 0 and skill.get('level', 1) < skill['lvlMax']:
-                            if st.button(f"Améliorer la compétence (1 point)", key=f"skill_{monster_id}_{i}", type="primary"):
-                                response = requests.put(
-                                    f"{MONSTERS_API_URL}/monsters/{monster_id}/skills/{i+1}",
-                                    headers={"Authorization": st.session_state["token"]}
-                                )
-                                if response.status_code == 200:
-                                    st.success("Compétence améliorée!")
-                                    st.rerun()
-                                else:
-                                    st.error("Erreur lors de l'amélioration de la compétence")
-                        elif skill.get('level', 1) >= skill['lvlMax']:
+                        if remaining_points > 0 and skill.get('level', 1) + queued < skill['lvlMax']:
+                            if st.button(f"Ajouter une amélioration (1 point)", key=f"skill_{monster_id}_{i}", type="primary"):
+                                queue[i] = queued + 1
+                                st.rerun()
+                        elif skill.get('level', 1) + queued >= skill['lvlMax']:
                             st.warning("Niveau maximum atteint!")
-                        elif monster['skill_points'] <= 0:
+                        elif remaining_points <= 0:
                             st.warning("Pas de points de compétence disponibles")
 
+            if queue:
+                col1, col2 = st.columns(2)
+                with col1:
+                    if st.button(f"✅ Valider les améliorations ({sum(queue.values())} point(s))", key=f"skill_commit_{monster_id}", type="primary"):
+                        response = requests.put(
+                            f"{MONSTERS_API_URL}/monsters/{monster_id}/skills",
+                            json={"upgrades": [{"skill": i + 1, "levels": levels} for i, levels in queue.items()]},
+                            headers={"Authorization": st.session_state["token"]}
+                        )
+                        queue.clear()
+                        if response.status_code == 200:
+                            st.success("Compétences améliorées!")
+                            st.rerun()
+                        else:
+                            st.error(f"Erreur lors de l'amélioration des compétences : {response.json().get('error', response.text)}")
+                with col2:
+                    if st.button("Annuler", key=f"skill_cancel_{monster_id}"):
+                        queue.clear()
+                        st.rerun()
+
             # Ajout du bouton de suppression du monstre
             st.markdown("---")
             delete_container = st.container()
@@ -409,18 +426,12 @@ if player_data:
     st.subheader("Vos Monstres")
     
     # Récupérer les détails de tous les monstres
-    monsters_details = {}
-    for monster_id in player_data["monsters"]:
-        try:
-            response = requests.get(
-                f"{MONSTERS_API_URL}/monsters/{monster_id}",
-                headers={"Authorization": st.session_state["token"]}
-            )
-            if response.status_code == 200:
-                monster = response.json()
-                monsters_details[monster_id] = monster
-        except Exception as e:
-            st.error(f"Erreur lors de la récupération des détails du monstre {monster_id}: {str(e)}")
+    try:
+        # La grille n'affiche que le nom, le niveau et le type
+        monsters_details = fetch_monsters(player_data["monsters"], fields=["name", "level", "monster_type"])
+    except Exception as e:
+        monsters_details = {}
+        st.error(f"Erreur lors de la récupération des détails des monstres : {str(e)}")
     
     monster_cols = st.columns(3)
     for i, monster_id in enumerate(player_data["monsters"]):
@@ -451,6 +462,35 @@ if player_data:
                     </div>
                 """, unsafe_allow_html=True)
                 
+    # Relâcher plusieurs monstres en une seule requête
+    if monsters_details:
+        with st.expander("🧹 Relâcher plusieurs monstres"):
+            to_release = st.multiselect(
+                "Monstres à relâcher",
+                options=[monster_id for monster_id in player_data["monsters"] if monster_id in monsters_details],
+                format_func=lambda monster_id: f"{monsters_details[monster_id]['name']} - Niveau {monsters_details[monster_id]['level']} ({monsters_details[monster_id]['monster_type']})",
+                key="release_selection"
+            )
+            if to_release and st.button(f"🗑️ Relâcher {len(to_release)} monstre(s)", key="release_confirm", type="secondary"):
+                response = requests.post(
+                    f"{MONSTERS_API_URL}/monsters/release",
+                    json={"ids": to_release},
+                    headers={"Authorization": st.session_state["token"]}
+                )
+                if response.status_code == 200:
+                    result = response.json()
+                    if result["released"]:
+                        st.success(f"{len(result['released'])} monstre(s) relâché(s)!")
+                    for failure in result["failed"]:
+                        st.error(f"Monstre {failure['id']} : {failure['error']}")
+                    if st.session_state.get("selected_monster") in result["released"]:
+                        del st.session_state["selected_monster"]
+                    del st.session_state["release_selection"]
+                    time.sleep(1)
+                    st.rerun()
+                else:
+                    st.error(f"Erreur lors de la libération des monstres : {response.text}")
+
     if "selected_monster" in st.session_state:
         st.markdown("---")
         display_monster_details(st.session_state["selected_monster"]) 
\ No newline at end of file
@@ -13,7 +13,7 @@ from constants import *
 import time
 import random
 import plotly.graph_objects as go
-from utils import setup_navigation
+from utils import clear_idempotency_key, idempotency_headers, setup_navigation
 
 print("[DEBUG INVOCATION] Démarrage de la page d'invocation")
 
@@ -169,42 +169,72 @@ if st.button("Invoquer un monstre", use_container_width=True):
         print(f"[DEBUG INVOCATION] Appel à l'API d'invocation : {SUMMON_API_URL}/summon")
         response = requests.post(
             f"{SUMMON_API_URL}/summon",
-            headers={"Authorization": st.session_state["token"]}
+            headers=idempotency_headers("summon")
         )
+        clear_idempotency_key("summon", response)
         print(f"[DEBUG INVOCATION] Réponse de l'invocation : {response.status_code} - {response.text}")
         
         if response.status_code == 201:
-            monster_id = response.json()["monster_id"]
-            print(f"[DEBUG INVOCATION] Monstre créé avec l'ID : {monster_id}")
+            # Le monstre créé est renvoyé directement par SummonAPI
+            monster = response.json()["monster"]
+            print(f"[DEBUG INVOCATION] Monstre créé : {monster}")
             
-            # Récupérer les détails du monstre
-            print(f"[DEBUG INVOCATION] Récupération des détails du monstre : {MONSTERS_API_URL}/monsters/{monster_id}")
-            monster_response = requests.get(
-                f"{MONSTERS_API_URL}/monsters/{monster_id}",
-                headers={"Authorization": st.session_state["token"]}
-            )
-            print(f"[DEBUG INVOCATION] Réponse des détails : {monster_response.status_code} - {monster_response.text}")
-            
-            if monster_response.status_code == 200:
-                monster = monster_response.json()
-                print(f"[DEBUG INVOCATION] Détails du monstre récupérés : {monster}")
+            # Afficher le résultat de l'invocation
+            with summon_container:
+                st.markdown(f"""
+                    <div class="summon-animation">
+                        <h2 style='color: #4CAF50;'>✨ Invocation réussie ! ✨</h2>
+                    </div>
+                """, unsafe_allow_html=True)
                 
-                # Afficher le résultat de l'invocation
-                with summon_container:
-                    st.markdown(f"""
-                        <div class="summon-animation">
-                            <h2 style='color: #4CAF50;'>✨ Invocation réussie ! ✨</h2>
-                        </div>
-                    """, unsafe_allow_html=True)
-                    
-                    # Afficher les détails du monstre
-                    display_monster_details(monster)
-            else:
-                print(f"[DEBUG INVOCATION] Erreur lors de la récupération des détails : {monster_response.text}")
-                st.error(f"Erreur lors de la récupération des détails du monstre. Code : {monster_response.status_code}, Message : {monster_response.text}")
+                # Afficher les détails du monstre
+                display_monster_details(monster)
+        elif response.status_code == 202:
+            summon_container.info("Invocation enregistrée : votre monstre rejoindra votre collection dans quelques instants.")
         else:
             print(f"[DEBUG INVOCATION] Erreur lors de l'invocation : {response.text}")
             st.error(f"Erreur lors de l'invocation. Code : {response.status_code}, Message : {response.text}")
     except Exception as e:
         print(f"[DEBUG INVOCATION] Exception lors de l'invocation : {str(e)}")
-        st.error(f"Erreur lors de l'invocation : {str(e)}") 
\ No newline at end of file
+        st.error(f"Erreur lors de l'invocation : {str(e)}") 
+
+if st.button("Invocation x10", use_container_width=True):
+    try:
+        with summon_container:
+            st.markdown("""
+                <div class="summon-animation">
+                    <h2 style='color: #4CAF50;'>✨ Invocation multiple en cours... ✨</h2>
+                    <div style='font-size: 48px; margin: 20px;'>
+                        <span style='animation: glow 1s infinite'>🌟</span>
+                    </div>
+                </div>
+            """, unsafe_allow_html=True)
+            time.sleep(1)
+
+        # Une seule requête : les monstres créés sont renvoyés directement par SummonAPI
+        response = requests.post(
+            f"{SUMMON_API_URL}/summon/multi",
+            params={"count": 10},
+            headers=idempotency_headers("summon_multi")
+        )
+        clear_idempotency_key("summon_multi", response)
+        print(f"[DEBUG INVOCATION] Réponse de l'invocation multiple : {response.status_code}")
+
+        if response.status_code == 201:
+            monsters = response.json()["monsters"]
+            with summon_container:
+                st.markdown(f"""
+                    <div class="summon-animation">
+                        <h2 style='color: #4CAF50;'>✨ {len(monsters)} monstres invoqués ! ✨</h2>
+                    </div>
+                """, unsafe_allow_html=True)
+            for monster in monsters:
+                with st.expander(f"{monster['name']} - {monster['monster_type']}"):
+                    display_monster_details(monster)
+        elif response.status_code == 202:
+            summon_container.info("Invocation enregistrée : vos monstres rejoindront votre collection dans quelques instants.")
+        else:
+            st.error(f"Erreur lors de l'invocation. Code : {response.status_code}, Message : {response.json().get('error', response.text)}")
+    except Exception as e:
+        print(f"[DEBUG INVOCATION] Exception lors de l'invocation multiple : {str(e)}")
+        st.error(f"Erreur lors de l'invocation : {str(e)}")
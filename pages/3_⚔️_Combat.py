@@ -10,7 +10,7 @@ st.set_page_config(
 
 import requests
 from constants import *
-from utils import display_monster_details, setup_navigation
+from utils import clear_idempotency_key, fetch_monsters, idempotency_headers, setup_navigation
 import time
 import random
 
@@ -105,6 +105,7 @@ try:
     # D'abord, récupérer la liste des IDs des monstres du joueur
     player_response = requests.get(
         f"{PLAYER_API_URL}/player",
+        params={"fields": "monsters"},
         headers={"Authorization": st.session_state["token"]}
     )
     print(f"[DEBUG COMBAT] Code de réponse Player API : {player_response.status_code}")
@@ -116,20 +117,9 @@ try:
         print(f"[DEBUG COMBAT] IDs des monstres récupérés : {monster_ids}")
         
         # Ensuite, récupérer les détails de chaque monstre
-        player_monsters = []
-        for monster_id in monster_ids:
-            print(f"[DEBUG COMBAT] Récupération des détails du monstre {monster_id}")
-            monster_response = requests.get(
-                f"{MONSTERS_API_URL}/monsters/{monster_id}",
-                headers={"Authorization": st.session_state["token"]}
-            )
-            print(f"[DEBUG COMBAT] Réponse pour le monstre {monster_id} : {monster_response.status_code}")
-            
-            if monster_response.status_code == 200:
-                monster = monster_response.json()
-                player_monsters.append(monster)
-            else:
-                print(f"[DEBUG COMBAT] Erreur lors de la récupération du monstre {monster_id} : {monster_response.text}")
+        print(f"[DEBUG COMBAT] Récupération groupée des détails de {len(monster_ids)} monstre(s)")
+        monsters_by_id = fetch_monsters(monster_ids)
+        player_monsters = [monsters_by_id[monster_id] for monster_id in monster_ids if monster_id in monsters_by_id]
         
         print(f"[DEBUG COMBAT] Tous les monstres récupérés : {player_monsters}")
         
@@ -223,12 +213,13 @@ if selected_monster and opponent_monster:
             print(f"[DEBUG COMBAT] Appel à l'API de combat : {BATTLE_API_URL}/battle")
             response = requests.post(
                 f"{BATTLE_API_URL}/battle",
-                headers={"Authorization": st.session_state["token"]},
+                headers=idempotency_headers(f"battle_{selected_monster}_{opponent_monster}"),
                 json={
                     "monster1_id": selected_monster,
                     "monster2_id": opponent_monster
                 }
             )
+            clear_idempotency_key(f"battle_{selected_monster}_{opponent_monster}", response)
             print(f"[DEBUG COMBAT] Réponse du combat : {response.status_code} - {response.text}")
 
             if response.status_code == 200:
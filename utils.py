@@ -2,8 +2,9 @@ import streamlit as st
 import requests
 import plotly.graph_objects as go
 from constants import *
-import math  # Ajout de l'import math
+from common.progression import xp_to_next_level
 import time  # Ajout de l'import time
+import uuid
 
 def setup_navigation():
     """Configure la barre de navigation et le style commun pour toutes les pages."""
@@ -53,6 +54,11 @@ def setup_navigation():
     # Ajouter le bouton de déconnexion en bas de la barre latérale
     with st.sidebar:
         if st.button("📤 Se déconnecter"):
+            # Révocation du token côté AuthAPI (sans bloquer la déconnexion en cas d'erreur)
+            try:
+                requests.post(f"{AUTH_API_URL}/revoke", json={"token": st.session_state.get("token")}, timeout=5)
+            except requests.exceptions.RequestException as e:
+                print(f"[DEBUG] Erreur lors de la révocation du token : {e}")
             st.session_state.clear()
             st.switch_page("dashboard.py")
 
@@ -103,7 +109,7 @@ def display_player_stats():
                 
             # Graphique d'expérience
             # Calcul de l'expérience nécessaire pour le niveau suivant
-            exp_to_next_level = int(50 * math.pow(1.1, player_data["level"]))
+            exp_to_next_level = xp_to_next_level(player_data["level"])
             
             fig = go.Figure(go.Indicator(
                 mode="gauge+number+delta",
@@ -143,10 +149,62 @@ def display_player_stats():
             st.plotly_chart(fig, use_container_width=True)
             
             return player_data
+        elif response.status_code == 404:
+            # Juste après l'inscription, le joueur peut encore être en cours de création côté serveur
+            status_response = requests.get(
+                f"{AUTH_API_URL}/register/status",
+                headers={"Authorization": st.session_state["token"]}
+            )
+            if status_response.status_code == 200 and status_response.json().get("status") == "pending":
+                st.info("⏳ Création de ton profil en cours...")
+                time.sleep(1)
+                st.rerun()
+            st.error("Profil joueur introuvable.")
+            return None
     except Exception as e:
         st.error(f"Erreur lors de la récupération des données du joueur : {str(e)}")
         return None
 
+def idempotency_headers(action):
+    """
+    Headers d'une requête POST non rejouable (invocation, combat) : la clé d'idempotence de `action`
+    est conservée tant qu'aucune réponse définitive n'a été reçue, pour qu'un nouveau clic ou un
+    rerun après une erreur réseau réutilise la même clé au lieu de refaire le traitement.
+    """
+    key = st.session_state.setdefault(f"idempotency_key_{action}", str(uuid.uuid4()))
+    return {"Authorization": st.session_state["token"], "Idempotency-Key": key}
+
+def clear_idempotency_key(action, response):
+    """
+    Oublie la clé de `action` une fois la réponse définitive (hors erreur serveur) : l'action suivante est une nouvelle requête.
+    """
+    if response.status_code < 500:
+        st.session_state.pop(f"idempotency_key_{action}", None)
+
+# Taille maximale d'une lecture groupée côté MonstersAPI (MAX_BATCH_IDS)
+MONSTERS_BATCH_SIZE = 200
+
+def fetch_monsters(monster_ids, fields=None):
+    """
+    Récupère les détails de plusieurs monstres via POST /monsters/batch (un appel par tranche de
+    MONSTERS_BATCH_SIZE identifiants), éventuellement limités aux champs `fields`.
+    Retourne un dict {id: monstre} ; les monstres introuvables sont absents.
+    """
+    params = {"fields": ",".join(fields)} if fields else None
+    monsters = {}
+    for start in range(0, len(monster_ids), MONSTERS_BATCH_SIZE):
+        response = requests.post(
+            f"{MONSTERS_API_URL}/monsters/batch",
+            params=params,
+            json={"ids": monster_ids[start:start + MONSTERS_BATCH_SIZE]},
+            headers={"Authorization": st.session_state["token"]}
+        )
+        if response.status_code != 200:
+            raise Exception(f"MonstersAPI a répondu {response.status_code} : {response.text}")
+        for monster in response.json()["monsters"]:
+            monsters[monster["_id"]] = monster
+    return monsters
+
 def display_monster_details(monster_id):
     try:
         response = requests.get(